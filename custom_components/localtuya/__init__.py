@@ -4,8 +4,9 @@ import logging
 import voluptuous as vol
 
 from homeassistant.config_entries import SOURCE_IMPORT, ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.const import (
+    EVENT_HOMEASSISTANT_STOP,
     CONF_DEVICE_ID,
     CONF_ID,
     CONF_ICON,
@@ -19,7 +20,16 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity import Entity
 
 from . import pytuya
-from .const import CONF_LOCAL_KEY, CONF_PROTOCOL_VERSION, DOMAIN
+from .const import (
+    CONF_LOCAL_KEY,
+    CONF_MAX_CONCURRENT_REQUESTS,
+    CONF_PROTOCOL_VERSION,
+    DOMAIN,
+    DPS_GROUP_FAST,
+)
+from .coordinator import TuyaDeviceCoordinator
+from .scheduler import DEFAULT_MAX_CONCURRENT, PollScheduler
+from .storage import async_get_device_store
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -27,6 +37,22 @@ DEFAULT_ID = "1"
 DEFAULT_PROTOCOL_VERSION = 3.3
 
 UNSUB_LISTENER = "unsub_listener"
+TUYA_DEVICE = "tuya_device"
+HEARTBEATS = "heartbeats"
+SCHEDULER = "scheduler"
+
+CONFIG_SCHEMA = vol.Schema(
+    {
+        vol.Optional(DOMAIN, default={}): vol.Schema(
+            {
+                vol.Optional(
+                    CONF_MAX_CONCURRENT_REQUESTS, default=DEFAULT_MAX_CONCURRENT
+                ): cv.positive_int,
+            }
+        )
+    },
+    extra=vol.ALLOW_EXTRA,
+)
 
 BASE_PLATFORM_SCHEMA = {
     vol.Optional(CONF_ICON): cv.icon,  # Deprecated: not used
@@ -42,7 +68,7 @@ BASE_PLATFORM_SCHEMA = {
 }
 
 
-def prepare_setup_entities(config_entry, platform):
+def prepare_setup_entities(hass, config_entry, platform):
     """Prepare ro setup entities for a platform."""
     entities_to_setup = [
         entity
@@ -52,17 +78,9 @@ def prepare_setup_entities(config_entry, platform):
     if not entities_to_setup:
         return None, None
 
-    device = pytuya.TuyaDevice(
-        config_entry.data[CONF_DEVICE_ID],
-        config_entry.data[CONF_HOST],
-        config_entry.data[CONF_LOCAL_KEY],
-    )
-    device.set_version(float(config_entry.data[CONF_PROTOCOL_VERSION]))
-
-    for device_config in entities_to_setup:
-        # this has to be done in case the device type is type_0d
-        device.add_dps_to_request(device_config[CONF_ID])
-
+    # all platforms share the coordinator of the config entry, which already
+    # requests the dps of every entity (needed in case the device type is type_0d)
+    device = hass.data[DOMAIN][config_entry.entry_id][TUYA_DEVICE]
     return device, entities_to_setup
 
 
@@ -81,6 +99,16 @@ def import_from_yaml(hass, config, platform):
 async def async_setup(hass: HomeAssistant, config: dict):
     """Set up the LocalTuya integration component."""
     hass.data.setdefault(DOMAIN, {})
+    # one timer sends the heartbeats of all device connections
+    hass.data[DOMAIN][HEARTBEATS] = pytuya.HeartbeatScheduler()
+    # polls of all devices share a bounded number of workers
+    conf = config.get(DOMAIN, {})
+    scheduler = PollScheduler(
+        hass, conf.get(CONF_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_CONCURRENT)
+    )
+    hass.data[DOMAIN][SCHEDULER] = scheduler
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, scheduler.stop)
+    await async_get_device_store(hass)
     return True
 
 
@@ -88,9 +116,18 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry):
     """Set up LocalTuya integration from a config entry."""
     unsub_listener = entry.add_update_listener(update_listener)
 
+    device = TuyaDeviceCoordinator(
+        hass,
+        entry,
+        hass.data[DOMAIN][HEARTBEATS],
+        hass.data[DOMAIN][SCHEDULER],
+        await async_get_device_store(hass),
+    )
     hass.data[DOMAIN][entry.entry_id] = {
         UNSUB_LISTENER: unsub_listener,
+        TUYA_DEVICE: device,
     }
+    hass.async_create_task(device.async_connect())
 
     for platform in set(entity[CONF_PLATFORM] for entity in entry.data[CONF_ENTITIES]):
         hass.async_create_task(
@@ -113,6 +150,7 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry):
     )
 
     hass.data[DOMAIN][entry.entry_id][UNSUB_LISTENER]()
+    await hass.data[DOMAIN][entry.entry_id][TUYA_DEVICE].async_close()
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
 
@@ -140,9 +178,33 @@ class LocalTuyaEntity(Entity):
         self._device = device
         self._config_entry = config_entry
         self._config = get_entity_config(config_entry, dps_id)
-        self._available = False
         self._dps_id = dps_id
-        self._status = None
+        self._status = {}
+
+    async def async_added_to_hass(self):
+        """Subscribe to status updates of the device."""
+        for group, dps in self.dps_groups().items():
+            self._device.add_dps_group(group, dps)
+        self.async_on_remove(
+            self._device.async_add_listener(
+                self._update_handler, self.dps_dependencies()
+            )
+        )
+        if self._device.available:
+            self._status = self._device.status
+            self.status_updated()
+
+    @callback
+    def _update_handler(self, status):
+        """Device status was updated or the device was disconnected."""
+        self._status = status
+        if self._device.available:
+            self.status_updated()
+        self.async_write_ha_state()
+
+    async def async_update(self):
+        """Refresh the device status, shared by all entities of the device."""
+        await self._device.async_refresh()
 
     @property
     def device_info(self):
@@ -162,6 +224,11 @@ class LocalTuyaEntity(Entity):
         """Get name of Tuya entity."""
         return self._config[CONF_FRIENDLY_NAME]
 
+    @property
+    def should_poll(self):
+        """Return False, the device coordinator pushes status updates."""
+        return False
+
     @property
     def unique_id(self):
         """Return unique device identifier."""
@@ -170,11 +237,16 @@ class LocalTuyaEntity(Entity):
     @property
     def available(self):
         """Return if device is available or not."""
-        return self._available
+        return self._device.available
+
+    @property
+    def assumed_state(self):
+        """Return True if commands are shown before the device confirms them."""
+        return self._device.optimistic
 
     def dps(self, dps_index):
         """Return cached value for DPS index."""
-        value = self._status["dps"].get(dps_index)
+        value = self._status.get(dps_index)
         if value is None:
             _LOGGER.warning(
                 "Entity %s is requesting unknown DPS index %s",
@@ -183,17 +255,21 @@ class LocalTuyaEntity(Entity):
             )
         return value
 
-    def update(self):
-        """Update state of Tuya entity."""
-        try:
-            self._status = self._device.status()
-            self.status_updated()
-        except Exception:
-            _LOGGER.info("update set available to False")
-            self._available = False
-        else:
-            self._available = True
-            _LOGGER.info("update set available to True")
+    def dps_dependencies(self):
+        """Return the dps the state of the entity is computed from.
+
+        The entity is only updated when one of them changes. Override in
+        subclasses reading more than their own dps.
+        """
+        return {self._dps_id}
+
+    def dps_groups(self):
+        """Return the dependencies of the entity by poll group.
+
+        Override in subclasses to move dps that rarely change to
+        DPS_GROUP_SLOW.
+        """
+        return {DPS_GROUP_FAST: self.dps_dependencies()}
 
     def status_updated(self):
         """Device status was updated.
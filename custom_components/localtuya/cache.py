@@ -0,0 +1,125 @@
+"""Status cache shared by everything that reads a device."""
+import asyncio
+import time
+
+
+class StatusCache:
+    """Last known dps of a device with single-flight refreshes.
+
+    The snapshot counts as fresh for `ttl` seconds after it was last
+    confirmed by the device, either by a full status query or by values it
+    pushed or acknowledged. Concurrent readers of a stale snapshot all wait
+    for the same query instead of sending one each.
+    """
+
+    def __init__(self, ttl, on_update=None):
+        """Initialize an empty cache.
+
+        on_update(changed) is called with the set of dps whose value changed.
+        """
+        self.ttl = ttl
+        self._on_update = on_update
+        self._snapshot = {}
+        self._updated = None
+        self._confirmed = {}
+        self._inflight = None
+
+    @property
+    def snapshot(self):
+        """Return the cached dps."""
+        return self._snapshot
+
+    @property
+    def is_fresh(self):
+        """Return if the snapshot is younger than the TTL."""
+        return (
+            self._updated is not None
+            and time.monotonic() - self._updated < self.ttl
+        )
+
+    def updated_since(self, timestamp):
+        """Return if the device confirmed values after time.monotonic() timestamp."""
+        return self._updated is not None and (
+            timestamp is None or self._updated > timestamp
+        )
+
+    def confirmed_since(self, timestamp, dps):
+        """Return if the device confirmed every one of dps after timestamp."""
+        return all(
+            index in self._confirmed
+            and (timestamp is None or self._confirmed[index] > timestamp)
+            for index in dps
+        )
+
+    @property
+    def refreshing(self):
+        """Return if a query is in flight."""
+        return self._inflight is not None
+
+    async def async_get(self, fetch, force=False):
+        """Return the snapshot, querying the device with fetch() when stale.
+
+        fetch is a coroutine function returning a dict of dps. Its errors are
+        raised to every reader waiting on it.
+        """
+        if self.is_fresh and not force:
+            return self._snapshot
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch(fetch))
+        # a cancelled reader must not cancel the query the others wait on
+        return await asyncio.shield(self._inflight)
+
+    async def _fetch(self, fetch):
+        try:
+            self.update(await fetch())
+            return self._snapshot
+        finally:
+            self._inflight = None
+
+    def update(self, dps):
+        """Merge values confirmed by the device into the snapshot."""
+        self._updated = time.monotonic()
+        self._confirmed.update(dict.fromkeys(dps, self._updated))
+        self._merge(dps)
+
+    def apply(self, dps):
+        """Merge values the device has not confirmed yet.
+
+        The snapshot is not made fresh by them. Returns the values they
+        replaced, for revert().
+        """
+        previous = {
+            index: self._snapshot[index] for index in dps if index in self._snapshot
+        }
+        self._merge(dps)
+        return previous
+
+    def revert(self, dps, previous):
+        """Undo apply(dps) for the dps the device did not report on since."""
+        reverted = set()
+        for index, value in dps.items():
+            if self._snapshot.get(index) != value:
+                continue
+            if index in previous:
+                self._snapshot[index] = previous[index]
+            else:
+                del self._snapshot[index]
+            reverted.add(index)
+        if reverted and self._on_update is not None:
+            self._on_update(reverted)
+
+    def _merge(self, dps):
+        changed = {
+            index
+            for index, value in dps.items()
+            if index not in self._snapshot or self._snapshot[index] != value
+        }
+        self._snapshot.update(dps)
+        if changed and self._on_update is not None:
+            self._on_update(changed)
+
+    def clear(self):
+        """Forget the snapshot, e.g. after the connection was lost."""
+        self._snapshot = {}
+        self._updated = None
+        self._confirmed = {}
@@ -1,5 +1,8 @@
 """Config flow for LocalTuya integration integration."""
+import asyncio
 import logging
+import time
+from copy import copy
 from importlib import import_module
 
 import voluptuous as vol
@@ -12,6 +15,7 @@ from homeassistant.const import (
     CONF_HOST,
     CONF_DEVICE_ID,
     CONF_FRIENDLY_NAME,
+    CONF_OPTIMISTIC,
     CONF_PLATFORM,
     CONF_SWITCHES,
 )
@@ -19,17 +23,36 @@ from homeassistant.const import (
 from . import pytuya
 from .const import (  # pylint: disable=unused-import
     CONF_LOCAL_KEY,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_MIN_POLL_INTERVAL,
     CONF_PROTOCOL_VERSION,
     CONF_DPS_STRINGS,
     CONF_YAML_IMPORT,
+    CONF_CACHE_TTL,
+    CONF_COALESCE_WINDOW,
+    CONF_RECONCILE_TIMEOUT,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_COALESCE_WINDOW,
+    DEFAULT_MAX_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    DEFAULT_RECONCILE_TIMEOUT,
     DOMAIN,
     PLATFORMS,
 )
 from .discovery import discover
+from .storage import (
+    ATTR_DEV_TYPE,
+    ATTR_DPS,
+    ATTR_ENTITIES,
+    ATTR_NAME,
+    async_get_device_store,
+    async_get_product_store,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
 DISCOVER_TIMEOUT = 6.0
+VALIDATE_TIMEOUT = 30
 
 PLATFORM_TO_ADD = "platform_to_add"
 NO_ADDITIONAL_PLATFORMS = "no_additional_platforms"
@@ -37,6 +60,26 @@ DISCOVERED_DEVICE = "discovered_device"
 
 CUSTOM_DEVICE = "..."
 
+# tuning of the connection, offered both when adding a device and in its options
+DEVICE_OPTIONS = {
+    vol.Optional(CONF_CACHE_TTL, default=DEFAULT_CACHE_TTL): vol.All(
+        vol.Coerce(int), vol.Range(min=0)
+    ),
+    vol.Optional(CONF_COALESCE_WINDOW, default=DEFAULT_COALESCE_WINDOW): vol.All(
+        vol.Coerce(int), vol.Range(min=0, max=1000)
+    ),
+    vol.Optional(CONF_OPTIMISTIC, default=False): bool,
+    vol.Optional(CONF_RECONCILE_TIMEOUT, default=DEFAULT_RECONCILE_TIMEOUT): vol.All(
+        vol.Coerce(int), vol.Range(min=1, max=60)
+    ),
+    vol.Optional(CONF_MIN_POLL_INTERVAL, default=DEFAULT_MIN_POLL_INTERVAL): vol.All(
+        vol.Coerce(int), vol.Range(min=1)
+    ),
+    vol.Optional(CONF_MAX_POLL_INTERVAL, default=DEFAULT_MAX_POLL_INTERVAL): vol.All(
+        vol.Coerce(int), vol.Range(min=1)
+    ),
+}
+
 BASIC_INFO_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_FRIENDLY_NAME): str,
@@ -45,7 +88,7 @@ BASIC_INFO_SCHEMA = vol.Schema(
         vol.Required(CONF_LOCAL_KEY): str,
         vol.Required(CONF_PROTOCOL_VERSION, default="3.3"): vol.In(["3.1", "3.3"]),
     }
-)
+).extend(DEVICE_OPTIONS)
 
 OPTIONS_SCHEMA = vol.Schema(
     {
@@ -54,7 +97,7 @@ OPTIONS_SCHEMA = vol.Schema(
         vol.Required(CONF_LOCAL_KEY): str,
         vol.Required(CONF_PROTOCOL_VERSION, default="3.3"): vol.In(["3.1", "3.3"]),
     }
-)
+).extend(DEVICE_OPTIONS)
 
 PICK_ENTITY_SCHEMA = vol.Schema(
     {vol.Required(PLATFORM_TO_ADD, default=PLATFORMS[0]): vol.In(PLATFORMS)}
@@ -71,8 +114,11 @@ def user_schema(devices):
 
 def schema_defaults(schema, dps_list=None, **defaults):
     """Create a new schema with default values filled in."""
-    copy = schema.extend({})
-    for field, field_type in copy.schema.items():
+    fields = {}
+    for field, field_type in schema.schema.items():
+        # markers are shared between schemas, so set defaults on a copy
+        field = copy(field)
+        fields[field] = field_type
         if isinstance(field_type, vol.In):
             value = None
             for dps in dps_list or []:
@@ -87,7 +133,7 @@ def schema_defaults(schema, dps_list=None, **defaults):
         if field.schema in defaults:
             field.default = vol.default_factory(defaults[field])
 
-    return copy
+    return vol.Schema(fields)
 
 
 def dps_string_list(dps_data):
@@ -126,24 +172,68 @@ def strip_dps_values(user_input, dps_strings):
     return stripped
 
 
-async def validate_input(hass: core.HomeAssistant, data):
-    """Validate the user input allows us to connect."""
-    pytuyadevice = pytuya.TuyaDevice(
-        data[CONF_DEVICE_ID],
-        data[CONF_HOST],
-        data[CONF_LOCAL_KEY],
-    )
-    pytuyadevice.set_version(float(data[CONF_PROTOCOL_VERSION]))
-    detected_dps = {}
+def suggested_entities(product, name):
+    """Return the entities of a known product, named after device name."""
+    entities = []
+    for entity in product.get(ATTR_ENTITIES, []):
+        entity = dict(entity)
+        friendly_name = entity[CONF_FRIENDLY_NAME]
+        if product.get(ATTR_NAME) and friendly_name.startswith(product[ATTR_NAME]):
+            entity[CONF_FRIENDLY_NAME] = name + friendly_name[len(product[ATTR_NAME]) :]
+        entities.append(entity)
+    return entities
+
+
+def validate_options(data):
+    """Validate the device options, raise InvalidPollIntervals if they clash."""
+    min_interval = data.get(CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL)
+    max_interval = data.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL)
+    if min_interval > max_interval:
+        raise InvalidPollIntervals
 
+
+async def validate_input(hass: core.HomeAssistant, data, product=None):
+    """Validate the user input allows us to connect.
+
+    Once the entry is created its dps strings are kept in the entry data,
+    so the options flow and reloads do not probe again.
+
+    The dps of a known product are not probed, a single status query
+    checks the connection and reads their values.
+    """
+    device_store = await async_get_device_store(hass)
+    known = device_store.get(data[CONF_DEVICE_ID])
+    detected_dps = {}
+    interface = None
+    # connecting and probing must not keep the user waiting for longer
+    deadline = time.monotonic() + VALIDATE_TIMEOUT
     try:
-        detected_dps = await hass.async_add_executor_job(
-            pytuyadevice.detect_available_dps
+        interface = await pytuya.connect(
+            data[CONF_HOST],
+            data[CONF_DEVICE_ID],
+            data[CONF_LOCAL_KEY],
+            float(data[CONF_PROTOCOL_VERSION]),
+            deadline=deadline,
+            dev_type=known.get(ATTR_DEV_TYPE) or (product or {}).get(ATTR_DEV_TYPE),
+        )
+        if product:
+            interface.add_dps_to_request(product[ATTR_DPS])
+            status = await interface.status(deadline)
+            detected_dps = {
+                index: status["dps"].get(index, "?") for index in product[ATTR_DPS]
+            }
+        else:
+            detected_dps = await interface.detect_available_dps(deadline)
+        device_store.async_update(
+            data[CONF_DEVICE_ID], **{ATTR_DEV_TYPE: interface.dev_type}
         )
-    except (ConnectionRefusedError, ConnectionResetError):
+    except (OSError, asyncio.TimeoutError):
         raise CannotConnect
     except ValueError:
         raise InvalidAuth
+    finally:
+        if interface:
+            interface.close()
 
     return dps_string_list(detected_dps)
 
@@ -179,6 +269,7 @@ class LocaltuyaConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
         try:
             devices = await discover(DISCOVER_TIMEOUT, self.hass.loop)
+            await self._async_learn_products(devices)
             self.devices = {
                 ip: dev
                 for ip, dev in devices.items()
@@ -200,13 +291,28 @@ class LocaltuyaConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             self._abort_if_unique_id_configured()
 
             try:
+                validate_options(user_input)
                 self.basic_info = user_input
-                self.dps_strings = await validate_input(self.hass, user_input)
+                product = await self._async_selected_product(
+                    user_input[CONF_DEVICE_ID]
+                )
+                self.dps_strings = await validate_input(
+                    self.hass, user_input, product
+                )
+                if product and not self.entities:
+                    self.entities = suggested_entities(
+                        product, user_input[CONF_FRIENDLY_NAME]
+                    )
+                    if self.entities:
+                        # offers to finish right away with the suggested entities
+                        self.platform = self.entities[-1][CONF_PLATFORM]
                 return await self.async_step_pick_entity_type()
             except CannotConnect:
                 errors["base"] = "cannot_connect"
             except InvalidAuth:
                 errors["base"] = "invalid_auth"
+            except InvalidPollIntervals:
+                errors["base"] = "invalid_poll_intervals"
             except Exception:  # pylint: disable=broad-except
                 _LOGGER.exception("Unexpected exception")
                 errors["base"] = "unknown"
@@ -225,6 +331,36 @@ class LocaltuyaConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             errors=errors,
         )
 
+    async def _async_selected_product(self, device_id):
+        """Return the known product of the picked device, None for another id."""
+        if self.selected_device is None:
+            return None
+        device = self.devices[self.selected_device]
+        # the user may have entered another device than the discovered one
+        if device.get("gwId") != device_id:
+            return None
+        product_store = await async_get_product_store(self.hass)
+        return product_store.get(device.get("productKey"))
+
+    async def _async_learn_products(self, devices):
+        """Learn the products of discovered devices that are configured."""
+        product_store = await async_get_product_store(self.hass)
+        device_store = await async_get_device_store(self.hass)
+        entries = {
+            entry.unique_id: entry for entry in self._async_current_entries()
+        }
+        for dev in devices.values():
+            entry = entries.get(dev["gwId"])
+            if entry is None or not entry.data.get(CONF_DPS_STRINGS):
+                continue
+            product_store.async_learn(
+                dev.get("productKey"),
+                entry.data[CONF_FRIENDLY_NAME],
+                [dps.split(" ")[0] for dps in entry.data[CONF_DPS_STRINGS]],
+                entry.data[CONF_ENTITIES],
+                device_store.get(dev["gwId"]).get(ATTR_DEV_TYPE),
+            )
+
     async def async_step_pick_entity_type(self, user_input=None):
         """Handle asking if user wants to add another entity."""
         if user_input is not None:
@@ -322,23 +458,30 @@ class LocalTuyaOptionsFlowHandler(config_entries.OptionsFlow):
 
     async def async_step_init(self, user_input=None):
         """Manage basic options."""
+        errors = {}
         device_id = self.config_entry.data[CONF_DEVICE_ID]
         if user_input is not None:
-            self.data = {
-                CONF_DEVICE_ID: device_id,
-                CONF_DPS_STRINGS: self.dps_strings,
-                CONF_ENTITIES: [],
-            }
-            self.data.update(user_input)
-            return await self.async_step_entity()
+            try:
+                validate_options(user_input)
+                self.data = {
+                    CONF_DEVICE_ID: device_id,
+                    CONF_DPS_STRINGS: self.dps_strings,
+                    CONF_ENTITIES: [],
+                }
+                self.data.update(user_input)
+                return await self.async_step_entity()
+            except InvalidPollIntervals:
+                errors["base"] = "invalid_poll_intervals"
 
         # Not supported for YAML imports
         if self.config_entry.data.get(CONF_YAML_IMPORT):
             return await self.async_step_yaml_import()
 
+        defaults = {**self.config_entry.data, **(user_input or {})}
         return self.async_show_form(
             step_id="init",
-            data_schema=schema_defaults(OPTIONS_SCHEMA, **self.config_entry.data),
+            data_schema=schema_defaults(OPTIONS_SCHEMA, **defaults),
+            errors=errors,
             description_placeholders={"device_id": device_id},
         )
 
@@ -392,3 +535,7 @@ class CannotConnect(exceptions.HomeAssistantError):
 
 class InvalidAuth(exceptions.HomeAssistantError):
     """Error to indicate there is invalid auth."""
+
+
+class InvalidPollIntervals(exceptions.HomeAssistantError):
+    """Error to indicate the shortest poll interval exceeds the longest."""
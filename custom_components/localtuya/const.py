@@ -8,6 +8,23 @@ CONF_LOCAL_KEY = "local_key"
 CONF_PROTOCOL_VERSION = "protocol_version"
 CONF_DPS_STRINGS = "dps_strings"
 CONF_YAML_IMPORT = "yaml_import"
+CONF_CACHE_TTL = "cache_ttl"
+CONF_COALESCE_WINDOW = "coalesce_window"
+CONF_RECONCILE_TIMEOUT = "reconcile_timeout"
+CONF_MIN_POLL_INTERVAL = "min_poll_interval"
+CONF_MAX_POLL_INTERVAL = "max_poll_interval"
+CONF_MAX_CONCURRENT_REQUESTS = "max_concurrent_requests"
+
+DEFAULT_CACHE_TTL = 15
+DEFAULT_COALESCE_WINDOW = 0  # milliseconds, 0 sends every write right away
+DEFAULT_RECONCILE_TIMEOUT = 5
+DEFAULT_MIN_POLL_INTERVAL = 15
+DEFAULT_MAX_POLL_INTERVAL = 120
+
+# dps poll groups, fast ones follow the adaptive poll interval
+DPS_GROUP_FAST = "fast"
+DPS_GROUP_SLOW = "slow"
+SLOW_POLL_INTERVAL = 600
 
 # switch
 CONF_CURRENT = "current"
@@ -0,0 +1,459 @@
+"""Connection and status of a Tuya device, shared by all entities of a config entry."""
+import asyncio
+import logging
+import time
+from functools import partial
+
+from homeassistant.const import (
+    CONF_DEVICE_ID,
+    CONF_ENTITIES,
+    CONF_HOST,
+    CONF_ID,
+    CONF_OPTIMISTIC,
+)
+from homeassistant.core import callback
+from homeassistant.helpers.event import async_call_later
+
+from . import pytuya
+from .cache import StatusCache
+from .const import (
+    CONF_CACHE_TTL,
+    CONF_COALESCE_WINDOW,
+    CONF_LOCAL_KEY,
+    CONF_MAX_POLL_INTERVAL,
+    CONF_MIN_POLL_INTERVAL,
+    CONF_PROTOCOL_VERSION,
+    CONF_RECONCILE_TIMEOUT,
+    DEFAULT_CACHE_TTL,
+    DEFAULT_COALESCE_WINDOW,
+    DEFAULT_MAX_POLL_INTERVAL,
+    DEFAULT_MIN_POLL_INTERVAL,
+    DEFAULT_RECONCILE_TIMEOUT,
+    DPS_GROUP_FAST,
+    DPS_GROUP_SLOW,
+    SLOW_POLL_INTERVAL,
+)
+from .health import CircuitBreaker
+from .scheduler import AdaptiveInterval
+from .storage import ATTR_DEV_TYPE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TuyaDeviceCoordinator(pytuya.TuyaListener):
+    """Owns the connection to one device and fans its status out to entities.
+
+    Every platform of a config entry uses the same coordinator, so a device
+    is polled once per cycle over a single connection no matter how many
+    entities it has. Polls are started by the fleet-wide PollScheduler, at
+    an interval that shrinks while polls find changes and grows while the
+    device stays quiet. Dps that entities put in the slow group are left
+    out of those polls on type_0d devices and only queried every
+    SLOW_POLL_INTERVAL seconds. Status frames pushed by the device are forwarded as
+    soon as they arrive, and refresh the cache so the next poll can be
+    skipped.
+
+    A circuit breaker tracks the health of the device. While it is open the
+    device is reported unavailable and commands fail right away, and the
+    connection is probed again with exponential backoff.
+
+    With a coalescing window configured, writes arriving within the window
+    are merged into a single multi-dps frame, later values of a dps
+    replacing earlier ones.
+
+    In optimistic mode written values show up in the status right away.
+    Values the device does not confirm within the reconciliation timeout
+    are rolled back and the status is queried again.
+    """
+
+    def __init__(self, hass, config_entry, heartbeats, scheduler, device_store):
+        """Initialize the coordinator."""
+        self._hass = hass
+        self._config_entry = config_entry
+        self._heartbeats = heartbeats
+        self._scheduler = scheduler
+        self._device_store = device_store
+        self._interface = None
+        self._cache = StatusCache(
+            config_entry.data.get(CONF_CACHE_TTL, DEFAULT_CACHE_TTL), self._notify
+        )
+        self._health = CircuitBreaker()
+        self._poll_interval = AdaptiveInterval(
+            config_entry.data.get(CONF_MIN_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL),
+            config_entry.data.get(CONF_MAX_POLL_INTERVAL, DEFAULT_MAX_POLL_INTERVAL),
+        )
+        self._coalesce_window = (
+            config_entry.data.get(CONF_COALESCE_WINDOW, DEFAULT_COALESCE_WINDOW)
+            / 1000
+        )
+        self._optimistic = config_entry.data.get(CONF_OPTIMISTIC, False)
+        self._reconcile_timeout = config_entry.data.get(
+            CONF_RECONCILE_TIMEOUT, DEFAULT_RECONCILE_TIMEOUT
+        )
+        self._polled_at = None
+        self._pending_writes = {}
+        self._write_deadline = None
+        self._write_batch = None
+        self._unsub_flush = None
+        self._listeners = []
+        self._notified_available = False
+        self._dps_to_request = set()
+        self._dps_groups = {DPS_GROUP_FAST: set(), DPS_GROUP_SLOW: set()}
+        self._slow_polled_at = None
+        self._unsub_reconnect = None
+        self._connecting = None
+        self._closing = False
+
+        for entity in config_entry.data[CONF_ENTITIES]:
+            self.add_dps_to_request(entity[CONF_ID])
+
+    @property
+    def unique_id(self):
+        """Return unique device identifier."""
+        return self._config_entry.data[CONF_DEVICE_ID]
+
+    @property
+    def available(self):
+        """Return if the device is connected and its status known."""
+        return (
+            self._interface is not None
+            and self._health.allow_request
+            and bool(self._cache.snapshot)
+        )
+
+    @property
+    def poll_interval(self):
+        """Return the seconds until the next poll."""
+        return self._poll_interval.interval
+
+    @property
+    def optimistic(self):
+        """Return if written values are shown before the device confirms them."""
+        return self._optimistic
+
+    @property
+    def status(self):
+        """Return the last known dps of the device."""
+        return self._cache.snapshot
+
+    def add_dps_to_request(self, dps_index):
+        """Add dps to query, needed for type_0d devices."""
+        if isinstance(dps_index, (int, str)):
+            dps_index = [dps_index]
+        self._dps_to_request.update(str(index) for index in dps_index)
+        if self._interface is not None:
+            self._interface.add_dps_to_request(self._dps_to_request)
+
+    def add_dps_group(self, group, dps_index):
+        """Add dps to a poll group, a dps in both groups is polled fast."""
+        self._dps_groups[group].update(str(index) for index in dps_index)
+        self.add_dps_to_request(dps_index)
+
+    def _dps_due(self):
+        """Return the dps the next poll asks for, None for all of them."""
+        slow = self._dps_groups[DPS_GROUP_SLOW] - self._dps_groups[DPS_GROUP_FAST]
+        if (
+            not slow
+            or self._slow_polled_at is None
+            or time.monotonic() - self._slow_polled_at >= SLOW_POLL_INTERVAL
+        ):
+            return None
+        return self._dps_to_request - slow
+
+    @callback
+    def async_add_listener(self, update_callback, dps=None):
+        """Call update_callback(status) when the status changes, return remover.
+
+        With dps given, only changes of those dps and of the availability
+        are reported.
+        """
+        listener = (update_callback, None if dps is None else frozenset(dps))
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener():
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+    async def async_connect(self):
+        """Connect to the device and start polling it."""
+        self._unsub_reconnect = None
+        if self._interface is not None or self._closing:
+            return
+
+        config = self._config_entry.data
+        known = self._device_store.get(config[CONF_DEVICE_ID])
+        self._health.probe()
+        # async_close() cancels a connect it finds still in flight
+        self._connecting = self._hass.async_create_task(
+            pytuya.connect(
+                config[CONF_HOST],
+                config[CONF_DEVICE_ID],
+                config[CONF_LOCAL_KEY],
+                float(config[CONF_PROTOCOL_VERSION]),
+                self,
+                self._heartbeats,
+                dev_type=known.get(ATTR_DEV_TYPE),
+            )
+        )
+        try:
+            interface = await self._connecting
+        except asyncio.CancelledError:
+            if not self._closing:
+                raise
+            return
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug("Failed to connect to %s", config[CONF_HOST], exc_info=True)
+            self._schedule_reconnect(self._health.trip())
+            return
+        finally:
+            self._connecting = None
+
+        if self._closing:
+            # the entry was unloaded while connecting
+            interface.close()
+            return
+        self._interface = interface
+        self._interface.add_dps_to_request(self._dps_to_request)
+        await self.async_refresh(force=True)
+        if self._interface is not None:
+            self._scheduler.add(self)
+
+    async def async_close(self):
+        """Close the connection and stop polling."""
+        self._closing = True
+        if self._connecting is not None:
+            self._connecting.cancel()
+        if self._unsub_reconnect:
+            self._unsub_reconnect()
+            self._unsub_reconnect = None
+        if self._unsub_flush:
+            self._unsub_flush.cancel()
+            self._unsub_flush = None
+            self._write_batch.set_result(None)
+            self._write_batch = None
+            self._pending_writes = {}
+        if self._interface is not None:
+            self._interface.close()
+
+    async def async_set_dps(self, value, dps_index, deadline=None):
+        """Set value of a dps and merge it into the cached status.
+
+        deadline is the time.monotonic() value the caller waits until, by
+        default the operation timeout of the connection.
+        """
+        await self.async_set_dps_many({dps_index: value}, deadline)
+
+    async def async_set_dps_many(self, dps, deadline=None):
+        """Set values of several dps in one frame and merge them into the status."""
+        dps = {str(index): value for index, value in dps.items()}
+        if deadline is None:
+            deadline = time.monotonic() + pytuya.OPERATION_TIMEOUT
+        optimistic = self._optimistic and self.available
+        if optimistic:
+            deadline = min(deadline, time.monotonic() + self._reconcile_timeout)
+            previous = self._cache.apply(dps)
+
+        if self._coalesce_window <= 0:
+            delta = await self._async_write(dps, deadline)
+        else:
+            delta = await self._async_write_coalesced(dps, deadline)
+
+        if optimistic:
+            unconfirmed = {
+                index: value
+                for index, value in dps.items()
+                if delta is None or index not in delta
+            }
+            if unconfirmed:
+                _LOGGER.debug(
+                    "Device %s did not confirm %s, rolling back",
+                    self._config_entry.data[CONF_HOST],
+                    unconfirmed,
+                )
+                self._cache.revert(unconfirmed, previous)
+                self._hass.async_create_task(self.async_refresh(force=True))
+
+    async def _async_write_coalesced(self, dps, deadline):
+        self._pending_writes.update(dps)
+        if self._write_deadline is None or deadline < self._write_deadline:
+            self._write_deadline = deadline
+        if self._write_batch is None:
+            self._write_batch = self._hass.loop.create_future()
+            self._unsub_flush = self._hass.loop.call_later(
+                self._coalesce_window, self._flush_writes
+            )
+        # a caller giving up must not cancel the write of the others
+        return await asyncio.shield(self._write_batch)
+
+    @callback
+    def _flush_writes(self):
+        dps, self._pending_writes = self._pending_writes, {}
+        deadline, self._write_deadline = self._write_deadline, None
+        batch, self._write_batch = self._write_batch, None
+        self._unsub_flush = None
+
+        async def write():
+            delta = None
+            try:
+                delta = await self._async_write(dps, deadline)
+            finally:
+                batch.set_result(delta)
+
+        self._hass.async_create_task(write())
+
+    async def _async_write(self, dps, deadline):
+        """Send dps to the device, return the confirmed delta or None on failure."""
+        if self._interface is None or not self._health.allow_request:
+            _LOGGER.error(
+                "Device %s is unavailable, cannot set dps %s",
+                self._config_entry.data[CONF_HOST],
+                ", ".join(dps),
+            )
+            return None
+        try:
+            # commands skip the poll workers, a slow poll of another device
+            # must not hold up a user turning something on
+            delta = await self._interface.set_dps_many(dps, deadline)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.error(
+                "Failed to set status of device %s: %s",
+                self._config_entry.data[CONF_HOST],
+                exc,
+            )
+            self._request_failed(exc)
+            return None
+        self._health.record_success()
+        # the reply tells what changed, no need to query the device again;
+        # status frames sent after it arrive through status_updated()
+        if delta:
+            self._cache.update(delta)
+        return delta
+
+    async def async_refresh(self, force=False, deadline=None, dps=None):
+        """Query the status of the device unless the cached one is fresh.
+
+        Callers arriving while a query is in flight share its result, and
+        the deadline and dps (all by default) of the caller that started it.
+        Returns if the status could be had.
+        """
+        if self._interface is None or not self._health.allow_request:
+            return False
+        try:
+            await self._cache.async_get(
+                partial(self._async_query_status, deadline, dps), force
+            )
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.debug(
+                "Failed to update status of device %s",
+                self._config_entry.data[CONF_HOST],
+                exc_info=True,
+            )
+            return False
+        return True
+
+    async def async_poll(self):
+        """Refresh the status on behalf of the poll scheduler.
+
+        Nothing is sent if every dps the poll would ask for was confirmed
+        since the previous poll, by command replies or pushed status frames,
+        or is younger than the cache TTL.
+        """
+        if self._interface is None or not self._health.allow_request:
+            return
+        dps = self._dps_due()
+        wanted = self._dps_to_request if dps is None else dps
+        since = time.monotonic() - self._cache.ttl
+        if self._polled_at is not None:
+            since = min(since, self._polled_at)
+        if wanted and self._cache.confirmed_since(since, wanted):
+            self._polled_at = time.monotonic()
+            if dps is None:
+                self._slow_polled_at = self._polled_at
+            return
+        before = dict(self._cache.snapshot)
+        started = time.monotonic()
+        # a poll must not run into the next one
+        refreshed = await self.async_refresh(
+            force=True,
+            deadline=started + self.poll_interval,
+            dps=dps,
+        )
+        if refreshed and dps is None:
+            # slow dps are only left out again once a full query got through
+            self._slow_polled_at = started
+        if self._cache.updated_since(self._polled_at):
+            self._poll_interval.observe(self._cache.snapshot != before)
+        self._polled_at = time.monotonic()
+
+    async def _async_query_status(self, deadline, dps):
+        # health is tracked here rather than in async_refresh, so a query
+        # shared by several callers counts once
+        try:
+            status = await self._interface.status(deadline, dps)
+        except Exception as exc:
+            self._request_failed(exc)
+            raise
+        self._health.record_success()
+        # the next connection starts with the dev_type found out now
+        self._device_store.async_update(
+            self.unique_id, **{ATTR_DEV_TYPE: self._interface.dev_type}
+        )
+        return status["dps"]
+
+    def status_updated(self, dps):
+        """Device pushed new values for some dps."""
+        self._cache.update(dps)
+
+    def disconnected(self, exc):
+        """Connection to the device was lost."""
+        _LOGGER.debug(
+            "Disconnected from %s: %s", self._config_entry.data[CONF_HOST], exc
+        )
+        self._interface = None
+        self._cache.clear()
+        self._scheduler.remove(self)
+        self._notify()
+        if not self._closing:
+            if self._health.allow_request:
+                self._health.trip()
+            self._schedule_reconnect(self._health.retry_delay)
+
+    @callback
+    def _notify(self, changed=None):
+        """Tell listeners about changed dps, or all of them when changed is None."""
+        available = self.available
+        if available != self._notified_available:
+            self._notified_available = available
+            changed = None
+        for update_callback, dps in list(self._listeners):
+            if changed is None or dps is None or not dps.isdisjoint(changed):
+                # one failing entity must not keep the others from updating
+                try:
+                    update_callback(self._cache.snapshot)
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception("Error updating listener of %s", self.unique_id)
+
+    @callback
+    def _request_failed(self, exc):
+        """Drop the connection once the device failed too many requests."""
+        if self._health.record_failure() is not None and self._interface is not None:
+            # disconnected() schedules the next probe
+            self._interface.abort(exc)
+
+    @callback
+    def _schedule_reconnect(self, delay):
+        if self._unsub_reconnect is None and not self._closing:
+            _LOGGER.debug(
+                "Reconnecting to %s in %.1fs",
+                self._config_entry.data[CONF_HOST],
+                delay,
+            )
+            self._unsub_reconnect = async_call_later(
+                self._hass, delay, self._reconnect
+            )
+
+    @callback
+    def _reconnect(self, now):
+        self._hass.async_create_task(self.async_connect())
@@ -26,8 +26,6 @@ cover:
   icon: mdi:blinds #OPTIONAL
 """
 import logging
-from time import time, sleep
-from threading import Lock
 
 import voluptuous as vol
 
@@ -43,7 +41,6 @@ from homeassistant.components.cover import (
 )
 from homeassistant.const import (
     CONF_ID,
-    CONF_FRIENDLY_NAME,
 )
 import homeassistant.helpers.config_validation as cv
 
@@ -59,11 +56,11 @@ from .const import (
     CONF_STOP_CMD,
     CONF_GET_POSITION,
     CONF_SET_POSITION,
-    CONF_LAST_MOVEMENT
+    CONF_LAST_MOVEMENT,
+    DPS_GROUP_FAST,
+    DPS_GROUP_SLOW,
 )
 
-from .pytuya import TuyaDevice
-
 _LOGGER = logging.getLogger(__name__)
 
 DEFAULT_OPEN_CMD = "open"
@@ -100,95 +97,36 @@ def flow_schema(dps):
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Setup a Tuya cover based on a config entry."""
     device, entities_to_setup = prepare_setup_entities(
-        config_entry, DOMAIN
+        hass, config_entry, DOMAIN
     )
     if not entities_to_setup:
         return
 
     covers = []
     for device_config in entities_to_setup:
+        for dps_index in (
+            device_config.get(CONF_GET_POSITION),
+            device_config.get(CONF_SET_POSITION),
+            device_config.get(CONF_LAST_MOVEMENT),
+        ):
+            if dps_index:
+                device.add_dps_to_request(dps_index)
+
         covers.append(
             LocaltuyaCover(
-                TuyaCache(device, config_entry.data[CONF_FRIENDLY_NAME]),
+                device,
                 config_entry,
                 device_config[CONF_ID],
             )
         )
 
-    async_add_entities(covers, True)
+    async_add_entities(covers)
 
 def setup_platform(hass, config, add_devices, discovery_info=None):
     """Set up of the Tuya cover."""
     return import_from_yaml(hass, config, DOMAIN)
 
 
-class TuyaCache:
-    """Cache wrapper for pytuya.TuyaDevice"""
-
-    def __init__(self, device, friendly_name):
-        _LOGGER.info("initiating TuyaCache")
-        """Initialize the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        self._device = device
-        self._friendly_name = friendly_name
-        self._lock = Lock()
-
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return self._device.id
-
-    def __get_status(self):
-        for i in range(5):
-            try:
-                status = self._device.status()
-                return status
-            except Exception:
-                print(
-                    "Failed to update status of device [{}]".format(
-                        self._device.address
-                    )
-                )
-                sleep(1.0)
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to update status of device %s", self._device.address
-                    )
-                    raise ConnectionError("Failed to update status .")
-
-    def set_dps(self, value, dps_index):
-        _LOGGER.debug("set_dps where value=%s dps_index=%s", value, dps_index)
-        """Change the Tuya cover status and clear the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        for i in range(5):
-            try:
-                return self._device.set_dps(value, dps_index)
-            except Exception:
-                print(
-                    "Failed to set status of device [{}]".format(self._device.address)
-                )
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to set status of device %s", self._device.address
-                    )
-                    return
-        self.update()
-
-    def status(self):
-        """Get state of Tuya cover and cache the results."""
-        self._lock.acquire()
-        try:
-            now = time()
-            if not self._cached_status or now - self._cached_status_time > 15:
-                sleep(0.5)
-                self._cached_status = self.__get_status()
-                self._cached_status_time = time()
-            return self._cached_status
-        finally:
-            self._lock.release()
-
 class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
     """Tuya cover devices."""
 
@@ -216,6 +154,26 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         """Check if the cover is fully closed."""
         return self._current_cover_position == 100
 
+    def dps_dependencies(self):
+        """Return the command, position and movement dps of the cover."""
+        dependencies = {self._dps_id}
+        for conf in (CONF_GET_POSITION, CONF_SET_POSITION, CONF_LAST_MOVEMENT):
+            # unset positions default to 0, which is no dps
+            if self._config.get(conf):
+                dependencies.add(str(self._config[conf]))
+        return dependencies
+
+    def dps_groups(self):
+        """Poll the last requested position slowly, only commands change it."""
+        dependencies = self.dps_dependencies()
+        if not self._config.get(CONF_SET_POSITION):
+            return {DPS_GROUP_FAST: dependencies}
+        set_position = str(self._config[CONF_SET_POSITION])
+        return {
+            DPS_GROUP_FAST: dependencies - {set_position},
+            DPS_GROUP_SLOW: {set_position},
+        }
+
     def status_updated(self):
         """Device status was updated."""
         _LOGGER.info("status_updated called ")
@@ -244,24 +202,24 @@ class LocaltuyaCover(LocalTuyaEntity, CoverEntity):
         return SUPPORT_OPEN | SUPPORT_CLOSE | SUPPORT_STOP | SUPPORT_SET_POSITION     
         #TODO set supported features dynamically based on config or yaml input
 
-    def set_cover_position(self, **kwargs):
+    async def async_set_cover_position(self, **kwargs):
         """Set the cover to a specific position from 0-100"""
         if ATTR_POSITION in kwargs:
             converted_position = int(kwargs[ATTR_POSITION])
             if converted_position in range(0,101):
                 _LOGGER.debug("set_cover_position about to set position to =%s", converted_position)
-                self._device.set_dps(converted_position, self._config[CONF_SET_POSITION])
+                await self._device.async_set_dps(converted_position, self._config[CONF_SET_POSITION])
             else:
                 _LOGGER.warning("set_position given number outside range")
 
-    def open_cover(self, **kwargs):
+    async def async_open_cover(self, **kwargs):
         """Open the cover."""
-        self._device.set_dps(self._config[CONF_OPEN_CMD], self._dps_id)
+        await self._device.async_set_dps(self._config[CONF_OPEN_CMD], self._dps_id)
 
-    def close_cover(self, **kwargs):
+    async def async_close_cover(self, **kwargs):
         """Close cover."""
-        self._device.set_dps(self._config[CONF_CLOSE_CMD], self._dps_id)
+        await self._device.async_set_dps(self._config[CONF_CLOSE_CMD], self._dps_id)
 
-    def stop_cover(self, **kwargs):
+    async def async_stop_cover(self, **kwargs):
         """Stop the cover."""
-        self._device.set_dps(self._config[CONF_STOP_CMD], self._dps_id)
\ No newline at end of file
+        await self._device.async_set_dps(self._config[CONF_STOP_CMD], self._dps_id)
@@ -9,19 +9,17 @@ import asyncio
 import logging
 from hashlib import md5
 
-from Cryptodome.Cipher import AES
+from .pytuya import AESCipher
 
 _LOGGER = logging.getLogger(__name__)
 
 UDP_KEY = md5(b"yGAdlopoPVldABfn").digest()
+UDP_CIPHER = AESCipher(UDP_KEY)
 
 
 def decrypt_udp(message):
     """Decrypt encrypted UDP broadcasts."""
-    def _unpad(data):
-        return data[:-ord(data[len(data) - 1:])]
-
-    return _unpad(AES.new(UDP_KEY, AES.MODE_ECB).decrypt(message)).decode()
+    return UDP_CIPHER.decrypt(message, False)
 
 
 class TuyaDiscovery(asyncio.DatagramProtocol):
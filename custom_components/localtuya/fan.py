@@ -29,11 +29,15 @@ from homeassistant.components.fan import (
     SUPPORT_OSCILLATE,
     SUPPORT_DIRECTION,
 )
-from homeassistant.const import CONF_ID, CONF_FRIENDLY_NAME, STATE_OFF
+from homeassistant.const import CONF_ID, STATE_OFF
 import homeassistant.helpers.config_validation as cv
 
-from . import BASE_PLATFORM_SCHEMA, prepare_setup_entities, import_from_yaml
-from .pytuya import TuyaDevice
+from . import (
+    BASE_PLATFORM_SCHEMA,
+    LocalTuyaEntity,
+    prepare_setup_entities,
+    import_from_yaml,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -48,7 +52,7 @@ def flow_schema(dps):
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Setup a Tuya fan based on a config entry."""
     device, entities_to_setup = prepare_setup_entities(
-        config_entry, DOMAIN
+        hass, config_entry, DOMAIN
     )
     if not entities_to_setup:
         return
@@ -56,15 +60,16 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     fans = []
 
     for device_config in entities_to_setup:
+        device.add_dps_to_request([LocaltuyaFan.DPS_INDEX_SPEED, LocaltuyaFan.DPS_INDEX_OSCILLATE])
         fans.append(
             LocaltuyaFan(
                 device,
-                device_config[CONF_FRIENDLY_NAME],
+                config_entry,
                 device_config[CONF_ID],
             )
         )
 
-    async_add_entities(fans, True)
+    async_add_entities(fans)
 
 
 def setup_platform(hass, config, add_devices, discovery_info=None):
@@ -72,17 +77,15 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
     return import_from_yaml(hass, config, DOMAIN)
 
 
-class LocaltuyaFan(FanEntity):
+class LocaltuyaFan(LocalTuyaEntity, FanEntity):
     """Representation of a Tuya fan."""
 
-    def __init__(self, device, friendly_name, switchid):
+    DPS_INDEX_SPEED = '2'
+    DPS_INDEX_OSCILLATE = '8'
+
+    def __init__(self, device, config_entry, fanid, **kwargs):
         """Initialize the entity."""
-        self._device = device
-        self._name = friendly_name
-        self._available = False
-        self._friendly_name = friendly_name
-        self._switch_id = switchid
-        self._status = self._device.status()
+        super().__init__(device, config_entry, fanid, **kwargs)
         self._state = False
         self._supported_features = SUPPORT_SET_SPEED | SUPPORT_OSCILLATE
         self._speed = STATE_OFF
@@ -96,11 +99,6 @@ class LocaltuyaFan(FanEntity):
         _LOGGER.debug("localtuya fan: oscillating = %s", self._oscillating)
         return self._oscillating
 
-    @property
-    def name(self) -> str:
-        """Get entity name."""
-        return self._name
-
     @property
     def is_on(self):
         """Check if Tuya switch is on."""
@@ -117,93 +115,66 @@ class LocaltuyaFan(FanEntity):
         return [STATE_OFF, SPEED_LOW, SPEED_MEDIUM, SPEED_HIGH]
         # return ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
 
-    def turn_on(self, speed: str = None, **kwargs) -> None:
+    async def async_turn_on(self, speed: str = None, **kwargs) -> None:
         """Turn on the entity."""
         _LOGGER.debug("localtuya fan: turn_on speed to: %s", speed)
         # if speed is None:
         #    speed = SPEED_MEDIUM
         # self.set_speed(speed)
-        self._device.turn_on()
+        await self._device.async_set_dps(True, self._dps_id)
         if speed is not None:
-            self.set_speed(speed)
-        self.schedule_update_ha_state()
+            await self.async_set_speed(speed)
 
-    def turn_off(self, **kwargs) -> None:
+    async def async_turn_off(self, **kwargs) -> None:
         """Turn off the entity."""
         _LOGGER.debug("localtuya fan: turn_off")
-        self._device.set_dps(False, '1')
-        self._state = False
-        self.schedule_update_ha_state()
+        await self._device.async_set_dps(False, self._dps_id)
 
-    def set_speed(self, speed: str) -> None:
+    async def async_set_speed(self, speed: str) -> None:
         """Set the speed of the fan."""
         _LOGGER.debug("localtuya fan: set_speed to: %s", speed)
-        self._speed = speed
-        # self.schedule_update_ha_state()
         if speed == STATE_OFF:
-            self._device.set_dps(False, '1')
-            self._state = False
+            await self._device.async_set_dps(False, self._dps_id)
         elif speed == SPEED_LOW:
-            self._device.set_dps('1', '2')
+            await self._device.async_set_dps('1', self.DPS_INDEX_SPEED)
         elif speed == SPEED_MEDIUM:
-            self._device.set_dps('2', '2')
+            await self._device.async_set_dps('2', self.DPS_INDEX_SPEED)
         elif speed == SPEED_HIGH:
-            self._device.set_dps('3', '2')
-        self.schedule_update_ha_state()
+            await self._device.async_set_dps('3', self.DPS_INDEX_SPEED)
 
     # def set_direction(self, direction: str) -> None:
     #    """Set the direction of the fan."""
     #    self.direction = direction
     #    self.schedule_update_ha_state()
 
-    def oscillate(self, oscillating: bool) -> None:
+    async def async_oscillate(self, oscillating: bool) -> None:
         """Set oscillation."""
-        self._oscillating = oscillating
-        self._device.set_value("8", oscillating)
-        self.schedule_update_ha_state()
+        await self._device.async_set_dps(oscillating, self.DPS_INDEX_OSCILLATE)
 
     # @property
     # def current_direction(self) -> str:
     #    """Fan direction."""
     #    return self.direction
 
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return f"local_{self._device.id}_{self._switch_id}"
-
-    @property
-    def available(self):
-        """Return if device is available or not."""
-        return self._available
-
     @property
     def supported_features(self) -> int:
         """Flag supported features."""
         return self._supported_features
 
-    def update(self):
-        """Get state of Tuya switch."""
-        success = False
-        for i in range(3):
-            if success is False:
-                try:
-                    status = self._device.status()
-                    _LOGGER.debug("localtuya fan: status = %s", status)
-                    self._state = status["dps"]["1"]
-                    if status["dps"]["1"] == False:
-                        self._speed = STATE_OFF
-                    elif int(status["dps"]["2"]) == 1:
-                        self._speed = SPEED_LOW
-                    elif int(status["dps"]["2"]) == 2:
-                        self._speed = SPEED_MEDIUM
-                    elif int(status["dps"]["2"]) == 3:
-                        self._speed = SPEED_HIGH
-                    # self._speed = status['dps']['2']
-                    self._oscillating = status["dps"]["8"]
-                    success = True
-                except ConnectionError:
-                    if i + 1 == 3:
-                        success = False
-                        raise ConnectionError("Failed to update status.")
-        self._available = success
+    def dps_dependencies(self):
+        """Return the power, speed and oscillation dps."""
+        return {self._dps_id, self.DPS_INDEX_SPEED, self.DPS_INDEX_OSCILLATE}
+
+    def status_updated(self):
+        """Get state of Tuya fan."""
+        self._state = self.dps(self._dps_id)
+        if not self._state:
+            self._speed = STATE_OFF
+        elif int(self.dps(self.DPS_INDEX_SPEED)) == 1:
+            self._speed = SPEED_LOW
+        elif int(self.dps(self.DPS_INDEX_SPEED)) == 2:
+            self._speed = SPEED_MEDIUM
+        elif int(self.dps(self.DPS_INDEX_SPEED)) == 3:
+            self._speed = SPEED_HIGH
+        # self._speed = status['dps']['2']
+        self._oscillating = self.dps(self.DPS_INDEX_OSCILLATE)
@@ -0,0 +1,69 @@
+"""Health tracking of a device connection."""
+import random
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+FAILURE_THRESHOLD = 3
+BACKOFF_BASE = 2
+BACKOFF_MAX = 300
+
+
+class CircuitBreaker:
+    """Per-device circuit breaker.
+
+    closed: the device answers, requests go through.
+    open: the device is known to be down, requests fail fast until the
+        next probe, which is scheduled with exponential backoff and jitter.
+    half_open: a probe is running, its outcome closes or re-opens the
+        circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=FAILURE_THRESHOLD,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX,
+    ):
+        """Initialize a closed circuit."""
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_delay = None
+
+    @property
+    def allow_request(self):
+        """Return if a request should be sent to the device."""
+        return self.state != STATE_OPEN
+
+    def probe(self):
+        """Mark the start of a probe of a device that was down."""
+        if self.state == STATE_OPEN:
+            self.state = STATE_HALF_OPEN
+
+    def record_success(self):
+        """Device answered, close the circuit."""
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self):
+        """Count a failed request, return the retry delay if it opened the circuit."""
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+            return self.trip()
+        return None
+
+    def trip(self):
+        """Open the circuit and return the delay until the next probe."""
+        self.state = STATE_OPEN
+        self.failures = 0
+        delay = min(self.backoff_max, self.backoff_base * 2 ** min(self.trips, 16))
+        self.trips += 1
+        # spread the probes of devices that went down together
+        self.retry_delay = random.uniform(delay / 2, delay)
+        return self.retry_delay
@@ -12,15 +12,9 @@ light:
     friendly_name: This Light
     protocol_version: 3.3
 """
-import socket
 import logging
-from time import time, sleep
-from threading import Lock
 
-from homeassistant.const import (
-    CONF_ID,
-    CONF_FRIENDLY_NAME,
-)
+from homeassistant.const import CONF_ID
 from homeassistant.components.light import (
     LightEntity,
     DOMAIN,
@@ -32,16 +26,19 @@ from homeassistant.components.light import (
     SUPPORT_COLOR,
     SUPPORT_COLOR_TEMP,
 )
-from homeassistant.util import color as colorutil
 
-from . import BASE_PLATFORM_SCHEMA, import_from_yaml, prepare_setup_entities
-from .pytuya import TuyaDevice
+from . import (
+    BASE_PLATFORM_SCHEMA,
+    LocalTuyaEntity,
+    prepare_setup_entities,
+    import_from_yaml,
+)
+from .const import DPS_GROUP_FAST, DPS_GROUP_SLOW
 
 _LOGGER = logging.getLogger(__name__)
 
 MIN_MIRED = 153
 MAX_MIRED = 370
-UPDATE_RETRY_LIMIT = 3
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(BASE_PLATFORM_SCHEMA)
 
@@ -52,9 +49,9 @@ def flow_schema(dps):
 
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
-    """Setup a Tuya switch based on a config entry."""
+    """Setup a Tuya light based on a config entry."""
     device, entities_to_setup = prepare_setup_entities(
-        config_entry, DOMAIN
+        hass, config_entry, DOMAIN
     )
     if not entities_to_setup:
         return
@@ -62,153 +59,67 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     lights = []
     for device_config in entities_to_setup:
         # this has to be done in case the device type is type_0d
-        device.add_dps_to_request(device_config[CONF_ID])
+        device.add_dps_to_request(
+            [LocaltuyaLight.DPS_INDEX_BRIGHTNESS, LocaltuyaLight.DPS_INDEX_COLOURTEMP]
+        )
 
         lights.append(
             LocaltuyaLight(
-                TuyaCache(device, config_entry.data[CONF_FRIENDLY_NAME]),
-                device_config[CONF_FRIENDLY_NAME],
+                device,
+                config_entry,
                 device_config[CONF_ID],
             )
         )
 
-    async_add_entities(lights, True)
+    async_add_entities(lights)
 
 
 def setup_platform(hass, config, add_devices, discovery_info=None):
-    """Set up of the Tuya switch."""
+    """Set up of the Tuya light."""
     return import_from_yaml(hass, config, DOMAIN)
 
 
-class TuyaCache:
-    """Cache wrapper for pytuya.TuyaDevices"""
-
-    def __init__(self, device, friendly_name):
-        """Initialize the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        self._device = device
-        self._friendly_name = friendly_name
-        self._lock = Lock()
-
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return self._device.id
-
-    def __get_status(self, switchid):
-        for _ in range(UPDATE_RETRY_LIMIT):
-            try:
-                return self._device.status()["dps"][switchid]
-            except (ConnectionError, socket.timeout):
-                pass
-        _LOGGER.warning("Failed to get status after %d tries", UPDATE_RETRY_LIMIT)
-
-    def set_dps(self, state, dps_index):
-        """Change the Tuya switch status and clear the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        for _ in range(UPDATE_RETRY_LIMIT):
-            try:
-                return self._device.set_dps(state, dps_index)
-            except ConnectionError:
-                pass
-            except socket.timeout:
-                pass
-        _LOGGER.warning("Failed to set status after %d tries", UPDATE_RETRY_LIMIT)
-
-    def status(self, switchid):
-        """Get state of Tuya switch and cache the results."""
-        with self._lock:
-            now = time()
-            if not self._cached_status or now - self._cached_status_time > 15:
-                sleep(0.5)
-                self._cached_status = self.__get_status(switchid)
-                self._cached_status_time = time()
-            return self._cached_status
-
-    def cached_status(self):
-        return self._cached_status
-
-   def state(self):
-        self._device.state();
- 
-class LocaltuyaLight(LightEntity):
-    """Representation of a Tuya switch."""
+class LocaltuyaLight(LocalTuyaEntity, LightEntity):
+    """Representation of a Tuya light."""
     DPS_INDEX_ON         = '1'
     DPS_INDEX_MODE       = '2'
     DPS_INDEX_BRIGHTNESS = '3'
     DPS_INDEX_COLOURTEMP = '4'
     DPS_INDEX_COLOUR     = '5'
 
-    def __init__(self, device, friendly_name, bulbid):
-        """Initialize the Tuya switch."""
-        self._device = device
-        self._available = False
-        self._name = friendly_name
+    def __init__(self, device, config_entry, bulbid, **kwargs):
+        """Initialize the Tuya light."""
+        super().__init__(device, config_entry, bulbid, **kwargs)
         self._state = False
         self._brightness = 127
         self._color_temp = 127
-        self._bulb_id = bulbid
 
     @property
-    def device_info(self):
-        return {
-            "identifiers": {
-                # Serial numbers are unique identifiers within a specific domain
-                ("LocalTuya", f"local_{self._device.unique_id}")
-            },
-            "name": self._device._friendly_name,
-            "manufacturer": "Tuya generic",
-            "model": "SmartLight",
-            "sw_version": "3.3",
-        }
-
-    def state(self):
-        self._device.state()
-
-    @property
-    def name(self):
-        """Get name of Tuya switch."""
-        return self._name
+    def is_on(self):
+        """Check if Tuya light is on."""
+        return self._state
 
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return f"local_{self._device.unique_id}"
+    def dps_dependencies(self):
+        """Return the power, brightness and colour temperature dps."""
+        return {self._dps_id, self.DPS_INDEX_BRIGHTNESS, self.DPS_INDEX_COLOURTEMP}
 
-    @property
-    def available(self):
-        """Return if device is available or not."""
-        return self._available
+    def dps_groups(self):
+        """Poll brightness and colour temperature slowly.
 
-    @property
-    def is_on(self):
-        """Check if Tuya switch is on."""
-        return self._state
+        They only change on commands, whose replies update them anyway.
+        """
+        return {
+            DPS_GROUP_FAST: {self._dps_id},
+            DPS_GROUP_SLOW: {self.DPS_INDEX_BRIGHTNESS, self.DPS_INDEX_COLOURTEMP},
+        }
 
-    def update(self):
-        """Get state of Tuya switch."""
-        try:
-            self._update_state()
-        except:
-            self._available = False
-        else:
-            self._available = True
-
-    def _update_state(self):
-        status = self._device.status(self._bulb_id)
-        self._state = status
-        try:
-            brightness = int(self._device.brightness())
-            if brightness > 254:
-                brightness = 255
-            if brightness < 25:
-                brightness = 25
-            self._brightness = brightness
-        except TypeError:
-            pass
-        self._color_temp = self._device.color_temp()
+    def status_updated(self):
+        """Device status was updated."""
+        self._state = self.dps(self._dps_id)
+        brightness = self._status.get(self.DPS_INDEX_BRIGHTNESS)
+        if brightness is not None:
+            self._brightness = max(25, min(255, int(brightness)))
+        self._color_temp = self._status.get(self.DPS_INDEX_COLOURTEMP)
 
     @property
     def brightness(self):
@@ -238,16 +149,19 @@ class LocaltuyaLight(LightEntity):
         """Return color temperature max mireds."""
         return MAX_MIRED
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turn on or control the light."""
-        _LOGGER.debug("Turning on, state: %s", self._device.cached_status())
-        if  not self._device.cached_status():
-            self._device.set_dps(True, self._bulb_id)
+        _LOGGER.debug("Turning on, state: %s", self._state)
+        # everything goes out in one frame, so the light never shows a
+        # mix of its old and new settings
+        states = {}
+        if not self._state:
+            states[self._dps_id] = True
         if ATTR_BRIGHTNESS in kwargs:
             converted_brightness = int(kwargs[ATTR_BRIGHTNESS])
             if converted_brightness <= 25:
                 converted_brightness = 25
-            self.set_brightness(converted_brightness)
+            states[self.DPS_INDEX_BRIGHTNESS] = converted_brightness
         if ATTR_HS_COLOR in kwargs:
             raise ValueError(" TODO implement RGB from HS")
         if ATTR_COLOR_TEMP in kwargs:
@@ -256,73 +170,22 @@ class LocaltuyaLight(LightEntity):
                 - (255 / (MAX_MIRED - MIN_MIRED))
                 * (int(kwargs[ATTR_COLOR_TEMP]) - MIN_MIRED)
             )
-            self._device.set_color_temp(color_temp)
+            states[self.DPS_INDEX_COLOURTEMP] = color_temp
+        if states:
+            await self._device.async_set_dps_many(states)
 
-    def turn_off(self, **kwargs):
-        """Turn Tuya switch off."""
-        self._device.set_dps(False, self._bulb_id)
+    async def async_turn_off(self, **kwargs):
+        """Turn Tuya light off."""
+        await self._device.async_set_dps(False, self._dps_id)
 
     @property
     def supported_features(self):
         """Flag supported features."""
         supports = SUPPORT_BRIGHTNESS
-        if self._device.color_temp() != "999":
-            supports = supports | SUPPORT_COLOR
-        # supports = supports | SUPPORT_COLOR_TEMP
+        if self._color_temp is not None:
+            supports = supports | SUPPORT_COLOR_TEMP
         return supports
 
-    def support_color(self):
-        return supported_features() & SUPPORT_COLOR
-
-    def support_color_temp(self):
-        return supported_features() & SUPPORT_COLOR_TEMP
-
-    def color_temp(self):
-        for _ in range(UPDATE_RETRY_LIMIT):
-            try:
-                return self._state[self.DPS][self.DPS_INDEX_COLOURTEMP]
-            except ConnectionError:
-                pass
-            except KeyError:
-                return "999"
-            except socket.timeout:
-                pass
-        log.warn(
-            "Failed to get color temp after {} tries".format(UPDATE_RETRY_LIMIT))
-
-    def set_color_temp(self, color_temp):
-        for _ in range(UPDATE_RETRY_LIMIT):
-            try:
-                if not 0 <= colourtemp <= 255:
-                    raise ValueError("The colour temperature needs to be between 0 and 255.")
-
-                self._device.set_dps(colourtemp, self.DPS_INDEX_COLOURTEMP)
-            except ConnectionError:
-                pass
-            except KeyError:
-                pass
-            except socket.timeout:
-                pass
-        log.warn(
-            "Failed to set color temp after {} tries".format(UPDATE_RETRY_LIMIT))
-
-    def set_brightness(self, brightness):
-        for _ in range(UPDATE_RETRY_LIMIT):
-            try:
-                if not 25 <= brightness <= 255:
-                    raise ValueError("The brightness needs to be between 25 and 255.")
-
-                self._device.set_dps(brightness, self.DPS_INDEX_BRIGHTNESS)
-            except ConnectionError:
-                pass
-            except KeyError:
-                pass
-            except socket.timeout:
-                pass
-        log.warn(
-            "Failed to set brightness after {} tries".format(UPDATE_RETRY_LIMIT))
-
-
     @staticmethod
     def _hexvalue_to_rgb(hexvalue):
         """
@@ -22,7 +22,14 @@
     detect_available_dps()   # returns a list of available dps provided by the device
     add_dps_to_request(dps_index)  # adds dps_index to the list of dps used by the device (to be queried in the payload)
     set_dps(on, dps_index)   # Set value of any dps index.
+    set_dps_many(dps)        # Set values of several dps in one frame, returns the dps the device confirmed
     set_timer(num_secs):
+    close()                  # closes the connection kept open when persist=True
+
+    TuyaProtocol             # asyncio.Protocol offering the same calls as coroutines
+    protocol = await connect(address, dev_id, local_key, protocol_version, listener, heartbeats)
+                             # listener (TuyaListener) is told about dps changed on the device
+                             # heartbeats (HeartbeatScheduler) keeps the connection alive
 
         
  Credits
@@ -34,26 +41,22 @@
     Updated pytuya to support devices with Device IDs of 22 characters
 """
 
+import asyncio
 import base64
+from collections import namedtuple
 from hashlib import md5
 from itertools import chain
 import json
 import logging
+import random
 import socket
+import struct
 import sys
+import threading
 import time
 import colorsys
 import binascii
 
-try:
-    #raise ImportError
-    import Crypto
-    from Crypto.Cipher import AES  # PyCrypto
-except ImportError:
-    Crypto = AES = None
-    import pyaes  # https://github.com/ricmoo/pyaes
-
-
 version_tuple = (8, 1, 0)
 version = version_string = __version__ = '%d.%d.%d' % version_tuple
 __author__ = 'rospogrigio'
@@ -64,35 +67,148 @@ logging.basicConfig()  # TODO include function name/line numbers in log
 
 log.debug('%s version %s', __name__, version)
 log.debug('Python %s on %s', sys.version, sys.platform)
-if Crypto is None:
-    log.debug('Using pyaes version %r', pyaes.VERSION)
-    log.debug('Using pyaes from %r', pyaes.__file__)
-else:
-    log.debug('Using PyCrypto %r', Crypto.version_info)
-    log.debug('Using PyCrypto from %r', Crypto.__file__)
 
 SET = 'set'
 STATUS = 'status'
+HEARTBEAT = 'heartbeat'
+
+STATUS_PUSH = 0x08  # command of the status frames a device sends on its own when dps change
+HEARTBEAT_CMD = 0x09
+
+HEARTBEAT_INTERVAL = 10  # devices drop connections that stay silent for about 30s
+HEARTBEAT_SLOTS = 20
+HEARTBEAT_MAX_MISSED = 2
+
+CONNECT_TIMEOUT = 5  # seconds to open the connection
+REQUEST_TIMEOUT = 5  # seconds to wait for the reply to one request
+OPERATION_TIMEOUT = 12  # seconds for a whole operation, including its retries
+
+# type_0d devices only report the dps they are asked for, experience shows that
+# they are usually in the ranges [1-30] and [100-110]. Each range is queried on
+# its own due to request payload limitation (max. length = 255).
+DPS_DETECT_RANGES = (range(1, 11), range(11, 21), range(21, 31), range(100, 111))
+
+PREFIX_VALUE = 0x000055AA
+SUFFIX_VALUE = 0x0000AA55
+PREFIX_BIN = struct.pack('>I', PREFIX_VALUE)
+MESSAGE_HEADER_FMT = '>4I'  # prefix, seqno, cmd, length
+MESSAGE_END_FMT = '>2I'  # crc, suffix
+MESSAGE_HEADER_SIZE = struct.calcsize(MESSAGE_HEADER_FMT)
+MESSAGE_END_SIZE = struct.calcsize(MESSAGE_END_FMT)
+MESSAGE_MAX_LENGTH = 0x10000  # anything longer is a corrupt length field
+
+# A message received from a device, payload excludes retcode, crc and suffix
+TuyaMessage = namedtuple('TuyaMessage', 'seqno cmd retcode payload crc')
 
 PROTOCOL_VERSION_BYTES_31 = b'3.1'
 PROTOCOL_VERSION_BYTES_33 = b'3.3'
 
 IS_PY2 = sys.version_info[0] == 2
 
-class AESCipher(object):
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    Cipher = None
+try:
+    from Cryptodome.Cipher import AES as CryptodomexAES  # pycryptodomex
+except ImportError:
+    CryptodomexAES = None
+try:
+    from Crypto.Cipher import AES as CryptodomeAES  # PyCrypto or pycryptodome
+except ImportError:
+    CryptodomeAES = None
+try:
+    import pyaes  # https://github.com/ricmoo/pyaes
+except ImportError:
+    pyaes = None
+
+
+class CryptographyBackend(object):
+    """AES-ECB provided by cryptography (OpenSSL)."""
+    name = 'cryptography'
+    available = Cipher is not None
+
+    def __init__(self, key):
+        # contexts are not thread safe, so one is created per call from the cached cipher
+        self._cipher = Cipher(algorithms.AES(key), modes.ECB(), backend=default_backend())
+
+    def encrypt(self, data):
+        encryptor = self._cipher.encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def decrypt(self, data):
+        decryptor = self._cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+
+class PyCryptodomeBackend(object):
+    """AES-ECB provided by pycryptodome (or PyCrypto)."""
+    name = 'pycryptodome'
+    AES = CryptodomeAES
+    available = CryptodomeAES is not None
+
+    def __init__(self, key):
+        self._cipher = self.AES.new(key, self.AES.MODE_ECB)  # ECB keeps no state between calls
+
+    def encrypt(self, data):
+        return self._cipher.encrypt(data)
+
+    def decrypt(self, data):
+        return self._cipher.decrypt(data)
+
+
+class PyCryptodomexBackend(PyCryptodomeBackend):
+    """AES-ECB provided by pycryptodomex."""
+    name = 'pycryptodomex'
+    AES = CryptodomexAES
+    available = CryptodomexAES is not None
+
+
+class PyaesBackend(object):
+    """Pure python AES-ECB provided by pyaes, orders of magnitude slower than the others."""
+    name = 'pyaes'
+    available = pyaes is not None
+
     def __init__(self, key):
+        self._cipher = pyaes.AESModeOfOperationECB(key)
+
+    def encrypt(self, data):
+        return b''.join(self._cipher.encrypt(data[i:i + 16]) for i in range(0, len(data), 16))
+
+    def decrypt(self, data):
+        return b''.join(self._cipher.decrypt(data[i:i + 16]) for i in range(0, len(data), 16))
+
+
+# Installed AES implementations, fastest first for message sized payloads (see benchmark.py)
+CRYPTO_BACKENDS = [
+    backend
+    for backend in (PyCryptodomexBackend, PyCryptodomeBackend, CryptographyBackend, PyaesBackend)
+    if backend.available
+]
+if not CRYPTO_BACKENDS:
+    raise ImportError('No AES implementation found, install cryptography, pycryptodome(x) or pyaes')
+log.debug('Using %s for AES (available: %s)', CRYPTO_BACKENDS[0].name, ', '.join(b.name for b in CRYPTO_BACKENDS))
+
+
+class AESCipher(object):
+    def __init__(self, key, backend=None):
+        """
+        AES-ECB with PKCS7 padding, optionally base64 encoded.
+
+        The cipher is set up once, keep the instance around to encrypt and
+        decrypt any number of messages with `key`.
+
+        Args:
+            key (bytes): The encryption key.
+            backend (class, optional): One of CRYPTO_BACKENDS. Defaults to the fastest.
+        """
         self.bs = 16
         self.key = key
+        self.backend = (backend or CRYPTO_BACKENDS[0])(key)
+
     def encrypt(self, raw, use_base64 = True):
-        if Crypto:
-            raw = self._pad(raw)
-            cipher = AES.new(self.key, mode=AES.MODE_ECB)
-            crypted_text = cipher.encrypt(raw)
-        else:
-            _ = self._pad(raw)
-            cipher = pyaes.blockfeeder.Encrypter(pyaes.AESModeOfOperationECB(self.key))  # no IV, auto pads to 16
-            crypted_text = cipher.feed(raw)
-            crypted_text += cipher.feed()  # flush final block
+        crypted_text = self.backend.encrypt(self._pad(raw))
         #print('crypted_text (%d) %r' % (len(crypted_text), crypted_text))
         if use_base64:
             return base64.b64encode(crypted_text)
@@ -102,21 +218,9 @@ class AESCipher(object):
     def decrypt(self, enc, use_base64=True):
         if use_base64:
             enc = base64.b64decode(enc)
-        #print('enc (%d) %r' % (len(enc), enc))
-        #enc = self._unpad(enc)
-        #enc = self._pad(enc)
-        #print('upadenc (%d) %r' % (len(enc), enc))
-        if Crypto:
-            cipher = AES.new(self.key, AES.MODE_ECB)
-            raw = cipher.decrypt(enc)
-            #print('raw (%d) %r' % (len(raw), raw))
-            return self._unpad(raw).decode('utf-8')
-            #return self._unpad(cipher.decrypt(enc)).decode('utf-8')
-        else:
-            cipher = pyaes.blockfeeder.Decrypter(pyaes.AESModeOfOperationECB(self.key))  # no IV, auto pads to 16
-            plain_text = cipher.feed(enc)
-            plain_text += cipher.feed()  # flush final block
-            return plain_text
+        raw = self.backend.decrypt(enc)
+        return self._unpad(raw).decode('utf-8')
+
     def _pad(self, s):
         padnum = self.bs - len(s) % self.bs
         return s + padnum * chr(padnum).encode()
@@ -143,9 +247,93 @@ def hex2bin(x):
     else:
         return bytes.fromhex(x)
 
+class MessageParser(object):
+    """
+    Incremental parser splitting a stream of bytes into TuyaMessages.
+
+    Bytes are buffered until a complete frame (0x000055AA prefix, header,
+    `length` bytes ending with CRC and 0x0000AA55 suffix) is available.
+    Frames with a bad suffix or CRC are dropped and parsing resumes at the
+    next prefix.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """Add received bytes and return the list of messages they completed."""
+        self._buffer += data
+        messages = []
+        while True:
+            start = self._buffer.find(PREFIX_BIN)
+            if start < 0:
+                # keep a possible partial prefix at the end
+                del self._buffer[:-(len(PREFIX_BIN) - 1)]
+                return messages
+            if start > 0:
+                log.debug('Discarding %d bytes before message prefix', start)
+                del self._buffer[:start]
+            if len(self._buffer) < MESSAGE_HEADER_SIZE:
+                return messages
+
+            _, seqno, cmd, length = struct.unpack_from(MESSAGE_HEADER_FMT, self._buffer)
+            if not MESSAGE_END_SIZE <= length <= MESSAGE_MAX_LENGTH:
+                log.debug('Discarding message with invalid length %d', length)
+                del self._buffer[:len(PREFIX_BIN)]
+                continue
+            end = MESSAGE_HEADER_SIZE + length
+            if len(self._buffer) < end:
+                return messages
+
+            crc, suffix = struct.unpack_from(MESSAGE_END_FMT, self._buffer, end - MESSAGE_END_SIZE)
+            if suffix != SUFFIX_VALUE:
+                log.debug('Discarding message with invalid suffix %08x', suffix)
+                del self._buffer[:len(PREFIX_BIN)]
+                continue
+            frame = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            if crc != binascii.crc32(frame[:-MESSAGE_END_SIZE]) & 0xffffffff:
+                log.warning('Discarding message with invalid CRC: %r', frame)
+                continue
+            messages.append(unpack_body(seqno, cmd, frame[MESSAGE_HEADER_SIZE:-MESSAGE_END_SIZE], crc))
+
+
+def unpack_body(seqno, cmd, body, crc):
+    """Split the return code, if any, from the body of a received frame."""
+    retcode = None
+    # replies start with a 4 byte return code, payloads never start with 3 zero bytes
+    if len(body) >= 4 and body[:3] == b'\0\0\0':
+        retcode = struct.unpack_from('>I', body)[0]
+        body = body[4:]
+    return TuyaMessage(seqno, cmd, retcode, body, crc)
+
+
+def pack_message(seqno, cmd, payload):
+    """
+    Build the frame sending `payload` as command `cmd`.
+
+    Header, payload, CRC and suffix are packed straight into one preallocated
+    buffer. The length field is a full 32 bit integer.
+    """
+    length = len(payload) + MESSAGE_END_SIZE
+    buffer = bytearray(MESSAGE_HEADER_SIZE + length)
+    struct.pack_into(MESSAGE_HEADER_FMT, buffer, 0, PREFIX_VALUE, seqno, cmd, length)
+    buffer[MESSAGE_HEADER_SIZE:-MESSAGE_END_SIZE] = payload
+    # calc the CRC of everything except where the CRC goes and the suffix
+    crc = binascii.crc32(memoryview(buffer)[:-MESSAGE_END_SIZE]) & 0xffffffff
+    struct.pack_into(MESSAGE_END_FMT, buffer, len(buffer) - MESSAGE_END_SIZE, crc, SUFFIX_VALUE)
+    return buffer
+
+
+# Payload of one command for one device, compiled from payload_dict by TuyaCommon:
+# fields are the json members that never change and payload the complete encoded
+# payload when there is nothing else (no timestamp or dps) to add to it
+CommandTemplate = namedtuple('CommandTemplate', 'cmd fields has_t has_dps payload')
+
 # This is intended to match requests.json payload at https://github.com/codetheweb/tuyapi :
 # type_0a devices require the 0a command as the status request
 # type_0d devices require the 0d command as the status request, and the list of dps used set to null in the request payload (see generate_payload method)
+# This dict only describes the commands and is never modified, see CommandTemplate
 payload_dict = {
   "type_0a": {
     "status": {
@@ -156,8 +344,10 @@ payload_dict = {
       "hexByte": "07",
       "command": {"devId": "", "uid": "", "t": ""}
     },
-    "prefix": "000055aa00000000000000",    # Next byte is command byte ("hexByte") some zero padding, then length of remaining payload, i.e. command + suffix (unclear if multiple bytes used for length, zero padding implies could be more than one byte)
-    "suffix": "000000000000aa55"
+    "heartbeat": {
+      "hexByte": "09",
+      "command": {}
+    }
   },
   "type_0d": {
     "status": {
@@ -168,14 +358,308 @@ payload_dict = {
       "hexByte": "07",
       "command": {"devId": "", "uid": "", "t": ""}
     },
-    "prefix": "000055aa00000000000000",    # Next byte is command byte ("hexByte") some zero padding, then length of remaining payload, i.e. command + suffix (unclear if multiple bytes used for length, zero padding implies could be more than one byte)
-    "suffix": "000000000000aa55"
+    "heartbeat": {
+      "hexByte": "09",
+      "command": {}
+    }
   }
 }
 
 
-class TuyaDevice(object):
-    def __init__(self, dev_id, address, local_key, connection_timeout=10):
+def time_left(timeout, deadline):
+    """
+    Return how many seconds the next phase of an operation may take.
+
+    Each phase (connect, request) has its own timeout, cut short by the
+    deadline of the whole operation, a time.monotonic() value or None.
+    The result is 0 or less once the deadline has passed.
+    """
+    if deadline is None:
+        return timeout
+    return min(timeout, deadline - time.monotonic())
+
+
+class TuyaCommon(object):
+    def __init__(self, dev_id, local_key):
+        """
+        Protocol state and payload handling shared by the device transports.
+
+        Args:
+            dev_id (str): The device id.
+            local_key (str): The encryption key.
+        """
+        self.id = dev_id
+        self.local_key = local_key.encode('latin1')
+        self.cipher = AESCipher(self.local_key)
+        self.version = 3.1
+        self.dev_type = 'type_0a'
+        self.dps_to_request = {}
+        self.seqno = 0
+        self._templates = {}
+
+    def set_version(self, version):
+        self.version = version
+        self._templates = {}  # precompiled payloads depend on the version
+
+    def set_dev_type(self, dev_type):
+        """Start with a known dev_type instead of finding out through a failed request."""
+        self.dev_type = dev_type
+
+    def _deadline(self, deadline):
+        """Return `deadline`, or the default one of an operation starting now."""
+        if deadline is None:
+            return time.monotonic() + self.operation_timeout
+        return deadline
+
+    def add_dps_to_request(self, dps_index):
+        if isinstance(dps_index, int):
+            self.dps_to_request[str(dps_index)] = None
+        else:
+            self.dps_to_request.update({str(index): None for index in dps_index})
+
+    @staticmethod
+    def _detect_query(dps_range):
+        """Return the dps asked for when probing `dps_range`."""
+        # dps 1 must always be sent, otherwise it might fail in case no dps is found in the requested range
+        return list(chain(["1"], dps_range))
+
+    @staticmethod
+    def _dps_query(dps):
+        """Return the dps field of a status request for `dps`, None for dps_to_request."""
+        if dps is None:
+            return None
+        return {str(index): None for index in dps}
+
+    def _next_seqno(self):
+        """Return the sequence number for the next message sent to the device."""
+        self.seqno = (self.seqno + 1) & 0xffffffff or 1  # 0 is used by unsolicited messages
+        return self.seqno
+
+    def _template(self, command):
+        """Return the precompiled CommandTemplate of `command` for the current dev_type."""
+        key = (self.dev_type, command)
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._compile_template(command)
+        return template
+
+    def _compile_template(self, command):
+        spec = payload_dict[self.dev_type][command]
+        fields = [
+            '"%s":%s' % (key, json.dumps(self.id))  # still use id, no seperate uid
+            for key in spec['command'] if key in ('gwId', 'devId', 'uid')
+        ]
+        has_t = 't' in spec['command']
+        # type_0d devices need the list of dps to query in the status request
+        has_dps = command == SET or spec['hexByte'] == '0d'
+        template = CommandTemplate(int(spec['hexByte'], 16), ','.join(fields), has_t, has_dps, None)
+        if not has_t and not has_dps:
+            # nothing changes between calls, encode (and encrypt) once
+            template = template._replace(payload=self._encode_payload(template, command, None))
+        return template
+
+    def _encode_payload(self, template, command, dps):
+        """Build the json of `template` with the current time and `dps`, then encrypt it."""
+        fields = [template.fields] if template.fields else []
+        if template.has_t:
+            fields.append('"t":"%d"' % int(time.time()))
+        if dps is not None:
+            fields.append('"dps":' + json.dumps(dps, separators=(',', ':')))  # device does not respond if spaces are present
+        json_payload = ('{' + ','.join(fields) + '}').encode('utf-8')
+        log.debug('json_payload=%r', json_payload)
+
+        if self.version == 3.3:
+            json_payload = self.cipher.encrypt(json_payload, False)
+            if template.cmd != 0x0a:
+                # add the 3.3 header
+                json_payload = PROTOCOL_VERSION_BYTES_33 + b"\0\0\0\0\0\0\0\0\0\0\0\0" + json_payload
+        elif command == SET:
+            # need to encrypt
+            json_payload = self.cipher.encrypt(json_payload)
+            preMd5String = b'data=' + json_payload + b'||lpv=' + PROTOCOL_VERSION_BYTES_31 + b'||' + self.local_key
+            m = md5()
+            m.update(preMd5String)
+            hexdigest = m.hexdigest()
+            json_payload = PROTOCOL_VERSION_BYTES_31 + hexdigest[8:][:16].encode('latin1') + json_payload
+        return json_payload
+
+    def generate_payload(self, command, data=None, seqno=0):
+        """
+        Generate the payload to send.
+
+        Args:
+            command(str): The type of command.
+                This is one of the entries from payload_dict
+            data(dict, optional): The data to be send.
+                This is what will be passed via the 'dps' entry, for type_0d
+                status requests it defaults to dps_to_request
+            seqno(int, optional): Sequence number echoed by the device in its reply.
+        """
+        template = self._template(command)
+        json_payload = template.payload
+        if json_payload is None:
+            if template.cmd == 0x0d and data is None:
+                data = self.dps_to_request
+            json_payload = self._encode_payload(template, command, data if template.has_dps else None)
+
+        return pack_message(seqno, template.cmd, json_payload)
+        
+    def _decode_payload(self, payload):
+        """Decrypt the payload of a received message and return it as text."""
+        result = payload
+        log.debug('result=%r', result)
+        if result.startswith(b'{'):
+            # this is the regular expected code path
+            pass
+        elif result.startswith(PROTOCOL_VERSION_BYTES_31):
+            # got an encrypted payload, happens occasionally
+            # expect resulting json to look similar to:: {"devId":"ID","dps":{"1":true,"2":0},"t":EPOCH_SECS,"s":3_DIGIT_NUM}
+            # NOTE dps.2 may or may not be present
+            result = result[len(PROTOCOL_VERSION_BYTES_31):]  # remove version header
+            result = result[16:]  # remove (what I'm guessing, but not confirmed is) 16-bytes of MD5 hexdigest of payload
+            result = self.cipher.decrypt(result)
+            log.debug('decrypted result=%r', result)
+        elif self.version == 3.3:
+            if result.startswith(PROTOCOL_VERSION_BYTES_33):
+                result = result[len(PROTOCOL_VERSION_BYTES_33) + 12:]  # remove the 3.3 header
+            result = self.cipher.decrypt(result, False)
+            log.debug('decrypted result=%r', result)
+        else:
+            raise ValueError('Unexpected payload=%r' % result)
+
+        if not isinstance(result, str):
+            result = result.decode()
+        return result
+
+    def _decode_status(self, msg):
+        """
+        Decode the reply to a status request.
+
+        Returns None if the device rejected the request because of the wrong
+        dev_type, in which case dev_type has been updated and the request should
+        be sent again.
+        """
+        result = self._decode_payload(msg.payload)
+        if "data unvalid" in result:
+            self.dev_type = 'type_0d'
+            log.debug("'data unvalid' error detected: switching to dev_type %r", self.dev_type)
+            return None
+        return json.loads(result)
+
+    def _decode_push(self, msg):
+        """Decode a status frame sent by the device and return its dps."""
+        return json.loads(self._decode_payload(msg.payload)).get('dps', {})
+
+    def _decode_set_reply(self, msg, dps):
+        """
+        Return the dps changed by a set command, given its reply `msg`.
+
+        Most devices acknowledge with an empty payload, meaning the values
+        were taken as sent. Some reply with the resulting dps instead, which
+        then take precedence.
+        """
+        if msg.retcode:
+            log.debug('%s answered set with retcode %d', self.id, msg.retcode)
+            return {}
+        delta = dict(dps)
+        if msg.payload:
+            try:
+                delta.update(self._decode_push(msg))
+            except ValueError:
+                log.debug('Ignoring undecodable set reply %r', msg)
+        return delta
+
+    def _is_reply(self, msg, expects_data):
+        """Return True if `msg` answers the request being waited for."""
+        if msg.cmd in (STATUS_PUSH, HEARTBEAT_CMD):
+            return False
+        # sometimes the device acks before replying with data
+        return bool(msg.payload) or not expects_data
+
+
+class HeartbeatScheduler(object):
+    def __init__(self, interval=HEARTBEAT_INTERVAL, slots=HEARTBEAT_SLOTS, max_missed=HEARTBEAT_MAX_MISSED):
+        """
+        Sends heartbeats for any number of TuyaProtocol connections from one timer.
+
+        Connections are kept on a timing wheel of `slots` slots advancing every
+        interval / slots seconds, so only the connections due in the current
+        slot are visited on each tick. Every visit sends a heartbeat and moves
+        the connection about one revolution ahead, plus or minus a random slot,
+        to keep the heartbeats of many devices from lining up. A connection whose
+        last `max_missed` heartbeats went unanswered is aborted, which reports
+        it as disconnected to its listener.
+
+        Args:
+            interval (float, optional): Seconds between heartbeats of a connection.
+            slots (int, optional): Number of slots of the wheel.
+            max_missed (int, optional): Unanswered heartbeats before giving up.
+        """
+        self.interval = interval
+        self.max_missed = max_missed
+        self._wheel = [set() for _ in range(slots)]
+        self._slot_of = {}
+        self._position = 0
+        self._timer = None
+        self._loop = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def add(self, protocol):
+        """Start sending heartbeats over `protocol`."""
+        if protocol in self._slot_of:
+            return
+        # spread new connections over the whole wheel
+        self._schedule(protocol, random.randrange(1, len(self._wheel) + 1))
+        if self._timer is None:
+            self._loop = asyncio.get_event_loop()
+            self._timer = self._loop.call_later(self.interval / len(self._wheel), self._advance)
+
+    def remove(self, protocol):
+        """Stop sending heartbeats over `protocol`."""
+        slot = self._slot_of.pop(protocol, None)
+        if slot is not None:
+            self._wheel[slot].discard(protocol)
+        if not self._slot_of and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule(self, protocol, ticks):
+        slot = (self._position + ticks) % len(self._wheel)
+        self._wheel[slot].add(protocol)
+        self._slot_of[protocol] = slot
+
+    def _advance(self):
+        slots = len(self._wheel)
+        self._position = (self._position + 1) % slots
+        due, self._wheel[self._position] = self._wheel[self._position], set()
+        for protocol in due:
+            del self._slot_of[protocol]
+            if protocol.heartbeat_pending:
+                protocol.missed_heartbeats += 1
+                if protocol.missed_heartbeats >= self.max_missed:
+                    log.warning('No heartbeat reply from %s, closing connection', protocol.id)
+                    protocol.abort(ConnectionResetError('Heartbeat timeout'))
+                    continue
+            protocol.heartbeat()
+            self._schedule(protocol, slots + random.randint(-1, 1))
+        self._timer = self._loop.call_later(self.interval / slots, self._advance)
+
+
+class TuyaListener(object):
+    """Interface for objects receiving updates pushed by a TuyaProtocol."""
+
+    def status_updated(self, dps):
+        """Device reported new values for (some of) its dps."""
+
+    def disconnected(self, exc):
+        """Connection to the device was lost (exc is None on a clean close)."""
+
+
+class TuyaDevice(TuyaCommon):
+    def __init__(self, dev_id, address, local_key, connection_timeout=CONNECT_TIMEOUT, persist=False,
+                 request_timeout=REQUEST_TIMEOUT, operation_timeout=OPERATION_TIMEOUT):
         """
         Represents a Tuya device.
         
@@ -183,257 +667,251 @@ class TuyaDevice(object):
             dev_id (str): The device id.
             address (str): The network address.
             local_key (str, optional): The encryption key. Defaults to None.
+            connection_timeout (int, optional): Seconds to open a connection.
+            persist (bool, optional): Keep the connection open between requests
+                and reconnect on errors. Call close() when done. Defaults to False.
+            request_timeout (int, optional): Seconds to wait for a reply.
+            operation_timeout (int, optional): Seconds a call may take in total,
+                reconnects included, unless the caller passes its own deadline.
             
         Attributes:
             port (int): The port to connect to.
         """
 
-        self.id = dev_id
+        super().__init__(dev_id, local_key)
         self.address = address
-        self.local_key = local_key.encode('latin1')
         self.connection_timeout = connection_timeout
-        self.version = 3.1
-        self.dev_type = 'type_0a'
-        self.dps_to_request = {}
+        self.request_timeout = request_timeout
+        self.operation_timeout = operation_timeout
+        self.persist = persist
+        self.socket = None
+        self._parser = None
+        self._lock = threading.Lock()  # serializes requests sharing the persistent socket
 
         self.port = 6668  # default - do not expect caller to pass in
         
     def __repr__(self):
         return '%r' % ((self.id, self.address),)  # FIXME can do better than this
 
-    def _send_receive(self, payload):
-        """
-        Send single buffer `payload` and receive a single buffer.
-        
-        Args:
-            payload(bytes): Data to send.
-        """
+    def _settimeout(self, s, timeout, deadline):
+        """Set the timeout of socket `s` for the next phase of an operation."""
+        timeout = time_left(timeout, deadline)
+        if timeout <= 0:
+            raise socket.timeout('Deadline exceeded for %s' % self.address)
+        s.settimeout(timeout)
+
+    def _connect(self, deadline=None):
+        """Open a new connection to the device and return the socket."""
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-            s.settimeout(self.connection_timeout)
+            if self.persist:
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self._settimeout(s, self.connection_timeout, deadline)
             s.connect((self.address, self.port))
         except Exception as e:
             print('Failed to connect to %s. Raising Exception.' % (self.address)) 
             raise e   
+        return s
+
+    def _exchange(self, s, parser, payload, seqno, expects_data, deadline=None, pushed=None):
+        """
+        Send `payload` over socket `s` and return the reply message for `seqno`.
+
+        The dps of status frames read while waiting are merged into `pushed`,
+        if given.
+        """
+        # the request timeout covers the whole reply, not each recv()
+        request_deadline = time.monotonic() + time_left(self.request_timeout, deadline)
         try:
-            s.send(payload)
+            self._settimeout(s, self.request_timeout, request_deadline)
+            s.sendall(payload)
         except Exception as e:
             print('Failed to send payload to %s. Raising Exception.' % (self.address)) 
-            #s.close()
             raise e   
 
         try:
-            data = s.recv(1024)
-#            print("FIRST:  Received %d bytes" % len(data) )
-        # sometimes the first packet does not contain data (typically 28 bytes): need to read again
-            if len(data) < 40:
-                time.sleep(0.1)
-                data = s.recv(1024)
-#                print("SECOND: Received %d bytes" % len(data) )
+            while True:
+                self._settimeout(s, self.request_timeout, request_deadline)
+                data = s.recv(4096)
+                if not data:
+                    raise ConnectionResetError('Connection closed by %s' % self.address)
+                for msg in parser.feed(data):
+                    # a reply to an earlier request that timed out is skipped
+                    if msg.seqno in (seqno, 0) and self._is_reply(msg, expects_data):
+                        return msg
+                    if msg.cmd == STATUS_PUSH and pushed is not None:
+                        try:
+                            pushed.update(self._decode_push(msg))
+                        except ValueError:
+                            log.debug('Ignoring undecodable status frame %r', msg)
+                        continue
+                    log.debug('Skipping message %r', msg)
         except Exception as e:
             print('Failed to receive data from %s. Raising Exception.' % (self.address)) 
-            #s.close()
             raise e   
 
-        s.close()
-        return data
+    def _send_receive(self, command, data=None, expects_data=True, deadline=None, pushed=None):
+        """
+        Send `command` and receive the reply message.
 
-    def set_version(self, version):
-        self.version = version
+        In persistent mode the connection is reused between calls. If the
+        existing connection turns out to be broken it is re-established once
+        before giving up.
+        
+        Args:
+            command(str): The type of command, see generate_payload.
+            data(dict, optional): The dps to send.
+            expects_data(bool): Wait for a reply carrying a payload, skipping
+                empty acknowledgements.
+            deadline(float, optional): time.monotonic() value by which the
+                call, reconnect included, must be done.
+            pushed(dict, optional): Collects the dps of status frames the
+                device sends while the reply is awaited.
+        """
+        deadline = self._deadline(deadline)
+        if not self.persist:
+            seqno = self._next_seqno()
+            payload = self.generate_payload(command, data, seqno)
+            s = self._connect(deadline)
+            try:
+                return self._exchange(s, MessageParser(), payload, seqno, expects_data, deadline, pushed)
+            finally:
+                s.close()
 
-    def detect_available_dps(self):
-        # type_0d devices need a sort of bruteforce querying in order to detect the list of available dps 
-        # experience shows that the dps available are usually in the ranges [1-25] and [100-110]
-        # need to split the bruteforcing in different steps due to request payload limitation (max. length = 255)
-        detected_dps = {}
+        with self._lock:
+            seqno = self._next_seqno()
+            payload = self.generate_payload(command, data, seqno)
+            reused = self.socket is not None
+            if not reused:
+                self._open_socket(deadline)
+            try:
+                return self._exchange(self.socket, self._parser, payload, seqno, expects_data, deadline, pushed)
+            except Exception:
+                self._close_socket()
+                if not reused:
+                    raise
+            # the kept connection went stale (device reboot, idle drop, ...)
+            log.debug('Reconnecting to %s', self.address)
+            self._open_socket(deadline)
+            try:
+                return self._exchange(self.socket, self._parser, payload, seqno, expects_data, deadline, pushed)
+            except Exception:
+                self._close_socket()
+                raise
 
-        # dps 1 must always be sent, otherwise it might fail in case no dps is found in the requested range
-        self.dps_to_request = {"1": None}
-        self.add_dps_to_request(range(2, 11))
-        try:
-            data = self.status()
-        except Exception as e:
-            print("Failed to get status: [{}]".format(e))
-            raise CannotConnect
-        detected_dps.update( data["dps"] )
+    def _open_socket(self, deadline=None):
+        self.socket = self._connect(deadline)
+        self._parser = MessageParser()
 
-        if self.dev_type == "type_0a":
-            return detected_dps
+    def _close_socket(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            finally:
+                self.socket = None
 
-        self.dps_to_request = {"1": None}
-        self.add_dps_to_request(range(11, 21))
-        try:
-            data = self.status()
-        except Exception as e:
-            print("Failed to get status: [{}]".format(e))
-            raise CannotConnect
-        detected_dps.update( data["dps"] )
+    def close(self):
+        """Close the persistent connection, if any."""
+        with self._lock:
+            self._close_socket()
 
-        self.dps_to_request = {"1": None}
-        self.add_dps_to_request(range(21, 31))
-        try:
-            data = self.status()
-        except Exception as e:
-            print("Failed to get status: [{}]".format(e))
-            raise CannotConnect
-        detected_dps.update( data["dps"] )
+    def detect_available_dps(self, deadline=None, ranges=DPS_DETECT_RANGES):
+        """
+        Return the dps provided by the device.
 
-        self.dps_to_request = {"1": None}
-        self.add_dps_to_request(range(100, 111))
+        type_0a devices report all their dps to the first status request.
+        type_0d devices are probed one range after the other over a single
+        connection. A range that fails is skipped, the call only fails if
+        nothing could be detected.
+
+        Args:
+            deadline(float, optional): time.monotonic() value by which the
+                whole probe must be done.
+            ranges(iterable, optional): The ranges of dps indexes to probe.
+        """
+        deadline = self._deadline(deadline)
+        detected_dps = {}
+        error = None
+        persist, self.persist = self.persist, True
         try:
-            data = self.status()
-        except Exception as e:
-            print("Failed to get status: [{}]".format(e))
-            raise CannotConnect
-        detected_dps.update( data["dps"] )
-#        print("DATA IS [{}] detected_dps [{}]".format(data,detected_dps))
+            for dps_range in ranges:
+                try:
+                    data = self.status(deadline, self._detect_query(dps_range))
+                except Exception as e:
+                    log.debug('Failed to probe dps %s: %s', dps_range, e)
+                    error = e
+                    continue
+                detected_dps.update(data["dps"])
 
-        return detected_dps
+                if self.dev_type == "type_0a":
+                    break
+        finally:
+            self.persist = persist
+            if not persist:
+                self.close()
 
-    def add_dps_to_request(self, dps_index):
-        if isinstance(dps_index, int):
-            self.dps_to_request[str(dps_index)] = None
-        else:
-            self.dps_to_request.update({str(index): None for index in dps_index})
+        if not detected_dps and error is not None:
+            raise error
+        return detected_dps
 
-    def generate_payload(self, command, data=None):
+    def status(self, deadline=None, dps=None):
         """
-        Generate the payload to send.
+        Return the status of the device.
 
         Args:
-            command(str): The type of command.
-                This is one of the entries from payload_dict
-            data(dict, optional): The data to be send.
-                This is what will be passed via the 'dps' entry
-        """
-        json_data = payload_dict[self.dev_type][command]['command']
-        command_hb = payload_dict[self.dev_type][command]['hexByte']
-
-        if 'gwId' in json_data:
-            json_data['gwId'] = self.id
-        if 'devId' in json_data:
-            json_data['devId'] = self.id
-        if 'uid' in json_data:
-            json_data['uid'] = self.id  # still use id, no seperate uid
-        if 't' in json_data:
-            json_data['t'] = str(int(time.time()))
-
-        if data is not None:
-            json_data['dps'] = data
-        if command_hb == '0d':
-            json_data['dps'] = self.dps_to_request
-#            log.info('******** COMMAND IS %r', self.dps_to_request)
-
-        # Create byte buffer from hex data
-        json_payload = json.dumps(json_data)
-        #print(json_payload)
-        json_payload = json_payload.replace(' ', '')  # if spaces are not removed device does not respond!
-        json_payload = json_payload.encode('utf-8')
-        log.debug('json_payload=%r', json_payload)
-        #print('json_payload = ', json_payload, ' cmd = ', command_hb)
-
-        if self.version == 3.3:
-            self.cipher = AESCipher(self.local_key)  # expect to connect and then disconnect to set new
-            json_payload = self.cipher.encrypt(json_payload, False)
-            self.cipher = None
-            if command_hb != '0a':
-                # add the 3.3 header
-                json_payload = PROTOCOL_VERSION_BYTES_33 + b"\0\0\0\0\0\0\0\0\0\0\0\0" + json_payload
-        elif command == SET:
-            # need to encrypt
-            self.cipher = AESCipher(self.local_key)  # expect to connect and then disconnect to set new
-            json_payload = self.cipher.encrypt(json_payload)
-            preMd5String = b'data=' + json_payload + b'||lpv=' + PROTOCOL_VERSION_BYTES_31 + b'||' + self.local_key
-            m = md5()
-            m.update(preMd5String)
-            hexdigest = m.hexdigest()
-            json_payload = PROTOCOL_VERSION_BYTES_31 + hexdigest[8:][:16].encode('latin1') + json_payload
-            self.cipher = None  # expect to connect and then disconnect to set new
-
-
-        postfix_payload = hex2bin(bin2hex(json_payload) + payload_dict[self.dev_type]['suffix'])
-        assert len(postfix_payload) <= 0xff
-        postfix_payload_hex_len = '%x' % len(postfix_payload)  # TODO this assumes a single byte 0-255 (0x00-0xff)
-        buffer = hex2bin( payload_dict[self.dev_type]['prefix'] + 
-                          payload_dict[self.dev_type][command]['hexByte'] + 
-                          '000000' +
-                          postfix_payload_hex_len ) + postfix_payload
-
-        # calc the CRC of everything except where the CRC goes and the suffix
-        hex_crc = format(binascii.crc32(buffer[:-8]) & 0xffffffff, '08X')
-        buffer = buffer[:-8] + hex2bin(hex_crc) + buffer[-4:]
-        #print('full buffer(%d) %r' % (len(buffer), bin2hex(buffer, pretty=True) ))
-        #print('full buffer(%d) %r' % (len(buffer), " ".join("{:02x}".format(ord(c)) for c in buffer)))
-        return buffer
-        
-    def status(self):
+            deadline(float, optional): time.monotonic() value by which the
+                call must be done.
+            dps(list, optional): The dps a type_0d device is asked for,
+                instead of dps_to_request. type_0a devices report all dps.
+        """
         log.debug('status() entry (dev_type is %s)', self.dev_type)
+        # the retry as type_0d shares the deadline of the first attempt
+        deadline = self._deadline(deadline)
         # open device, send request, then close connection
-        payload = self.generate_payload('status')
-
-        data = self._send_receive(payload)
+        data = self._send_receive(STATUS, self._dps_query(dps), deadline=deadline)
         log.debug('status received data=%r', data)
 
-        result = data[20:-8]  # hard coded offsets
-        if self.dev_type != 'type_0a':
-            result = result[15:]
-
-        log.debug('result=%r', result)
-        #result = data[data.find('{'):data.rfind('}')+1]  # naive marker search, hope neither { nor } occur in header/footer
-        #print('result %r' % result)
-        if result.startswith(b'{'):
-            # this is the regular expected code path
-            if not isinstance(result, str):
-                result = result.decode()
-            result = json.loads(result)
-        elif result.startswith(PROTOCOL_VERSION_BYTES_31):
-            # got an encrypted payload, happens occasionally
-            # expect resulting json to look similar to:: {"devId":"ID","dps":{"1":true,"2":0},"t":EPOCH_SECS,"s":3_DIGIT_NUM}
-            # NOTE dps.2 may or may not be present
-            result = result[len(PROTOCOL_VERSION_BYTES_31):]  # remove version header
-            result = result[16:]  # remove (what I'm guessing, but not confirmed is) 16-bytes of MD5 hexdigest of payload
-            cipher = AESCipher(self.local_key)
-            result = cipher.decrypt(result)
-            log.debug('decrypted result=%r', result)
-            if not isinstance(result, str):
-                result = result.decode()
-            result = json.loads(result)
-        elif self.version == 3.3: 
-            cipher = AESCipher(self.local_key)
-            result = cipher.decrypt(result, False)
-            log.debug('decrypted result=%r', result)
-            if "data unvalid" in result:
-                self.dev_type = 'type_0d'
-                log.debug("'data unvalid' error detected: switching to dev_type %r", self.dev_type)
-                return self.status()
-            if not isinstance(result, str):
-                result = result.decode()
-            result = json.loads(result)
-        else:
-            log.error('Unexpected status() payload=%r', result)
-
+        result = self._decode_status(data)
+        if result is None:
+            return self.status(deadline, dps)
         return result
     
-    def set_dps(self, value, dps_index):
+    def set_dps(self, value, dps_index, deadline=None):
         """
         Set value (may be any type: bool, int or string) of any dps index.
 
         Args:
             dps_index(int):   dps index to set
             value: new value for the dps index
+            deadline(float, optional): time.monotonic() value by which the
+                call must be done.
+        """
+        return self.set_dps_many({dps_index: value}, deadline)
+
+    def set_dps_many(self, dps, deadline=None):
+        """
+        Set the values of several dps in one frame.
+
+        Args:
+            dps(dict): dps index -> new value
+            deadline(float, optional): time.monotonic() value by which the
+                call must be done.
+
+        Returns the dps the device confirmed, including those of status
+        frames it sent while the reply was awaited.
         """
         # open device, send request, then close connection
-        if isinstance(dps_index, int):
-            dps_index = str(dps_index)  # index and payload is a string
+        dps = {str(index): value for index, value in dps.items()}  # index and payload is a string
 
-        payload = self.generate_payload(SET, {
-            dps_index: value})
-        
-        data = self._send_receive(payload)
+        # only frames pushed during this exchange count as confirmations
+        delta = {}
+        data = self._send_receive(SET, dps, expects_data=False, deadline=deadline, pushed=delta)
         log.debug('set_dps received data=%r', data)
-        
-        return data
+
+        # pushed frames may predate the reply, so it has the last word
+        delta.update(self._decode_set_reply(data, dps))
+        return delta
     
 
     def set_timer(self, num_secs):
@@ -452,8 +930,291 @@ class TuyaDevice(object):
         devices_numbers.sort()
         dps_id = devices_numbers[-1]
 
-        payload = self.generate_payload(SET, {dps_id:num_secs})
+        return self.set_dps_many({dps_id: num_secs})
+
+
+class TuyaProtocol(TuyaCommon, asyncio.Protocol):
+    def __init__(self, dev_id, local_key, protocol_version, on_connected, listener=None, heartbeats=None,
+                 request_timeout=REQUEST_TIMEOUT, operation_timeout=OPERATION_TIMEOUT):
+        """
+        Asyncio transport for a Tuya device.
+
+        Requests are sent over the connection made by connect() and their
+        replies are awaited on the event loop instead of in a thread. The
+        connection stays open, so status frames the device sends by itself
+        when a dps changes are decoded and handed to the listener.
+
+        Args:
+            dev_id (str): The device id.
+            local_key (str): The encryption key.
+            protocol_version (float): 3.1 or 3.3.
+            on_connected (asyncio.Future): Resolved when the connection is made.
+            listener (TuyaListener, optional): Receives pushed dps updates.
+            heartbeats (HeartbeatScheduler, optional): Keeps the connection alive.
+            request_timeout (int, optional): Seconds to wait for a reply.
+            operation_timeout (int, optional): Seconds a call may take in total,
+                retries included, unless the caller passes its own deadline.
+        """
+        super().__init__(dev_id, local_key)
+        self.set_version(protocol_version)
+        self.listener = listener or TuyaListener()
+        self.heartbeats = heartbeats
+        self.heartbeat_pending = False
+        self.missed_heartbeats = 0
+        self._abort_reason = None
+        self.request_timeout = request_timeout
+        self.operation_timeout = operation_timeout
+        self.transport = None
+        self.on_connected = on_connected
+        self._parser = MessageParser()
+        self._pending = {}  # seqno -> (future, expects_data) of requests awaiting a reply
+        self._echoes_seqno = True
+        self._serial = asyncio.Lock()  # one request at a time once replies lack the seqno
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.heartbeats is not None:
+            self.heartbeats.add(self)
+        if not self.on_connected.done():
+            self.on_connected.set_result(True)
+
+    def data_received(self, data):
+        for msg in self._parser.feed(data):
+            self._message_received(msg)
+
+    def _message_received(self, msg):
+        log.debug('received message=%r', msg)
+        # any message proves the connection is alive
+        self.heartbeat_pending = False
+        self.missed_heartbeats = 0
+        if msg.cmd == HEARTBEAT_CMD:
+            return
+        if msg.cmd == STATUS_PUSH:
+            try:
+                dps = self._decode_push(msg)
+            except Exception:
+                log.exception('Failed to decode status pushed by %s', self.id)
+                return
+            # an error in the listener must not kill the connection
+            try:
+                self.listener.status_updated(dps)
+            except Exception:
+                log.exception('Failed to handle status pushed by %s', self.id)
+            return
+        if msg.seqno in self._pending:
+            reply, expects_data = self._pending[msg.seqno]
+        elif msg.seqno == 0 and self._pending:
+            # device not echoing sequence numbers, assume replies come in order
+            if self._echoes_seqno:
+                log.debug('%s does not echo sequence numbers, no longer pipelining', self.id)
+                self._echoes_seqno = False
+            reply, expects_data = next(iter(self._pending.values()))
+        else:
+            log.debug('Dropping unexpected message=%r', msg)
+            return
+        if not reply.done() and self._is_reply(msg, expects_data):
+            reply.set_result(msg)
+
+    def connection_lost(self, exc):
+        exc = exc or self._abort_reason
+        log.debug('Connection to %s lost: %s', self.id, exc)
+        self.transport = None
+        if self.heartbeats is not None:
+            self.heartbeats.remove(self)
+        for reply, _ in self._pending.values():
+            if not reply.done():
+                reply.set_exception(exc or ConnectionResetError('Connection lost'))
+        self.listener.disconnected(exc)
+
+    def close(self):
+        """Close the connection to the device."""
+        if self.transport is not None:
+            self.transport.close()
+
+    def abort(self, exc):
+        """Drop a connection considered dead, reporting `exc` as the reason."""
+        if self.transport is not None:
+            self._abort_reason = exc
+            self.transport.abort()
+
+    def heartbeat(self):
+        """Send a heartbeat, the reply is tracked by heartbeat_pending."""
+        if self.transport is None:
+            return
+        self.heartbeat_pending = True
+        self.transport.write(self.generate_payload(HEARTBEAT, seqno=self._next_seqno()))
+
+    async def _send_receive(self, command, data=None, expects_data=True, deadline=None):
+        """
+        Send `command` and wait for the reply message.
+
+        Each request gets its own sequence number and the reply carrying it
+        resolves the request, so any number of requests can be in flight on
+        the connection at the same time. Replies of a device that does not
+        echo sequence numbers can only be matched by their order, so once
+        one is seen its requests are sent one at a time. The wait, for the
+        turn included, ends after the request timeout or at `deadline` (a
+        time.monotonic() value), whichever comes first.
+        """
+        if self.transport is None:
+            raise ConnectionResetError('Not connected to %s' % self.id)
+        timeout = time_left(self.request_timeout, deadline)
+        if timeout <= 0:
+            raise asyncio.TimeoutError('Deadline exceeded for %s' % self.id)
+        if self._echoes_seqno:
+            request = self._request(command, data, expects_data)
+        else:
+            request = self._request_serialized(command, data, expects_data)
+        return await asyncio.wait_for(request, timeout)
+
+    async def _request(self, command, data, expects_data):
+        if self.transport is None:
+            raise ConnectionResetError('Not connected to %s' % self.id)
+        seqno = self._next_seqno()
+        reply = asyncio.get_running_loop().create_future()
+        self._pending[seqno] = (reply, expects_data)
+        try:
+            self.transport.write(self.generate_payload(command, data, seqno))
+            return await reply
+        finally:
+            del self._pending[seqno]
+
+    async def _request_serialized(self, command, data, expects_data):
+        async with self._serial:
+            return await self._request(command, data, expects_data)
+
+    async def status(self, deadline=None, dps=None):
+        """Return the status of the device (see TuyaDevice.status)."""
+        log.debug('status() entry (dev_type is %s)', self.dev_type)
+        # the retry as type_0d shares the deadline of the first attempt
+        deadline = self._deadline(deadline)
+        data = await self._send_receive(STATUS, self._dps_query(dps), deadline=deadline)
+        log.debug('status received data=%r', data)
+
+        result = self._decode_status(data)
+        if result is None:
+            return await self.status(deadline, dps)
+        return result
+
+    async def set_dps(self, value, dps_index, deadline=None):
+        """
+        Set value (may be any type: bool, int or string) of any dps index.
+
+        Args:
+            dps_index(int):   dps index to set
+            value: new value for the dps index
+            deadline(float, optional): time.monotonic() value by which the
+                call must be done.
+        """
+        return await self.set_dps_many({dps_index: value}, deadline)
+
+    async def set_dps_many(self, dps, deadline=None):
+        """
+        Set the values of several dps in one frame.
+
+        Args:
+            dps(dict): dps index -> new value
+            deadline(float, optional): time.monotonic() value by which the
+                call must be done.
+
+        Returns the dps the device confirmed. Status frames it sends after
+        the reply go to the listener.
+        """
+        dps = {str(index): value for index, value in dps.items()}  # index and payload is a string
+
+        data = await self._send_receive(SET, dps, expects_data=False, deadline=deadline)
+        log.debug('set_dps received data=%r', data)
+        return self._decode_set_reply(data, dps)
+
+    async def detect_available_dps(self, deadline=None, ranges=DPS_DETECT_RANGES):
+        """
+        Return the dps provided by the device (see TuyaDevice.detect_available_dps).
+
+        Ranges are tried one at a time until one answers. Once that has
+        shown the device to be type_0d, the other ranges are queried at the
+        same time, pipelined on the connection. A range that fails is
+        skipped, the call only fails if no range answered.
+        """
+        deadline = self._deadline(deadline)
+        ranges = list(ranges)
+        error = None
+        while ranges:
+            dps_range = ranges.pop(0)
+            try:
+                data = await self.status(deadline, self._detect_query(dps_range))
+            except Exception as e:
+                log.debug('Failed to probe dps %s: %s', dps_range, e)
+                error = e
+                continue
+            break
+        else:
+            if error is not None:
+                raise error
+            return {}
+
+        detected_dps = dict(data["dps"])
+        if self.dev_type == "type_0a":
+            return detected_dps
+
+        results = await asyncio.gather(
+            *[self.status(deadline, self._detect_query(dps_range)) for dps_range in ranges],
+            return_exceptions=True,
+        )
+        for dps_range, result in zip(ranges, results):
+            if isinstance(result, Exception):
+                log.debug('Failed to probe dps %s: %s', dps_range, result)
+                continue
+            detected_dps.update(result["dps"])
+        return detected_dps
+
+
+async def connect(address, dev_id, local_key, protocol_version, listener=None, heartbeats=None, port=6668,
+                  request_timeout=REQUEST_TIMEOUT, connection_timeout=CONNECT_TIMEOUT,
+                  operation_timeout=OPERATION_TIMEOUT,
+                  deadline=None, dev_type=None):
+    """
+    Connect to a device and return its TuyaProtocol.
 
-        data = self._send_receive(payload)
-        log.debug('set_timer received data=%r', data)
-        return data
+    Args:
+        address (str): The network address.
+        dev_id (str): The device id.
+        local_key (str): The encryption key.
+        protocol_version (float): 3.1 or 3.3.
+        listener (TuyaListener, optional): Receives dps updates pushed by the device.
+        heartbeats (HeartbeatScheduler, optional): Sends the heartbeats keeping
+            the connection open.
+        port (int, optional): The port to connect to. Defaults to 6668.
+        request_timeout (int, optional): Seconds to wait for each reply.
+        connection_timeout (int, optional): Seconds to wait for the connection.
+        operation_timeout (int, optional): Seconds a status() or set_dps()
+            call may take in total when the caller passes no deadline.
+        deadline (float, optional): time.monotonic() value by which the
+            connection must be made.
+        dev_type (str, optional): The dev_type of the device if known, e.g.
+            from an earlier connection.
+    """
+    connection_timeout = time_left(connection_timeout, deadline)
+    if connection_timeout <= 0:
+        raise asyncio.TimeoutError('Deadline exceeded for %s' % address)
+    loop = asyncio.get_running_loop()
+    on_connected = loop.create_future()
+    _, protocol = await asyncio.wait_for(
+        loop.create_connection(
+            lambda: TuyaProtocol(
+                dev_id, local_key, protocol_version, on_connected, listener, heartbeats,
+                request_timeout, operation_timeout,
+            ),
+            address,
+            port,
+        ),
+        connection_timeout,
+    )
+    try:
+        await asyncio.wait_for(on_connected, connection_timeout)
+    except BaseException:
+        # cancelled or timed out with the connection made, do not leak it
+        protocol.close()
+        raise
+    if dev_type is not None:
+        protocol.set_dev_type(dev_type)
+    return protocol
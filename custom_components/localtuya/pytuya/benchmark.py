@@ -0,0 +1,56 @@
+"""
+Microbenchmark of the AES backends available to pytuya.
+
+Reports encrypt/decrypt throughput of every installed backend for payloads
+the size of typical Tuya messages. Run from the localtuya directory:
+
+    python -m pytuya.benchmark
+"""
+import os
+import time
+
+from . import CRYPTO_BACKENDS, AESCipher
+
+PAYLOAD_SIZES = (64, 256, 1024)
+DURATION = 0.5  # seconds spent on each measurement
+
+
+def measure(func, data, duration=DURATION):
+    """Return the throughput of func(data) in MB/s."""
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < duration:
+        for _ in range(100):
+            func(data)
+        calls += 100
+        elapsed = time.perf_counter() - start
+    return calls * len(data) / elapsed / 1e6
+
+
+def benchmark(sizes=PAYLOAD_SIZES, duration=DURATION):
+    """Return {backend name: {size: (encrypt MB/s, decrypt MB/s)}}."""
+    key = os.urandom(16)
+    results = {}
+    for backend in CRYPTO_BACKENDS:
+        cipher = AESCipher(key, backend).backend
+        results[backend.name] = {}
+        for size in sizes:
+            data = os.urandom(size)  # already padded to the block size
+            results[backend.name][size] = (
+                measure(cipher.encrypt, data, duration),
+                measure(cipher.decrypt, data, duration),
+            )
+    return results
+
+
+def main():
+    results = benchmark()
+    print('%-15s %8s %14s %14s' % ('backend', 'bytes', 'encrypt MB/s', 'decrypt MB/s'))
+    for name, sizes in results.items():
+        for size, (encrypt, decrypt) in sizes.items():
+            print('%-15s %8d %14.2f %14.2f' % (name, size, encrypt, decrypt))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Fleet-wide scheduling of device I/O."""
+import asyncio
+import logging
+
+from homeassistant.core import callback
+
+from .const import DEFAULT_MAX_POLL_INTERVAL, DEFAULT_MIN_POLL_INTERVAL
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 4
+POLL_INTERVAL = 30
+POLL_SLOTS = 30
+
+SPEED_UP_FACTOR = 0.5
+BACK_OFF_FACTOR = 1.5
+
+
+class AdaptiveInterval:
+    """Poll interval of one device, following how often its dps change.
+
+    A poll that finds a change halves the interval, a quiet one stretches
+    it by half, within [min_interval, max_interval].
+    """
+
+    def __init__(
+        self,
+        min_interval=DEFAULT_MIN_POLL_INTERVAL,
+        max_interval=DEFAULT_MAX_POLL_INTERVAL,
+    ):
+        """Initialize the interval, starting from the fastest rate."""
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.interval = min_interval
+
+    def observe(self, changed):
+        """Adjust the interval after a poll, return the new one."""
+        factor = SPEED_UP_FACTOR if changed else BACK_OFF_FACTOR
+        self.interval = min(
+            self.max_interval, max(self.min_interval, self.interval * factor)
+        )
+        return self.interval
+
+
+class PollScheduler:
+    """Polls the devices of all config entries with a bounded number of workers.
+
+    Devices sit on a timing wheel of `slots` slots that advances every
+    interval / slots seconds. New devices go to the least loaded slot, so
+    the polls of a large installation are spread evenly over the interval
+    instead of all firing at once. Due devices are queued and at most
+    `max_concurrent` of them are polled at the same time. A device still
+    queued from its previous turn is not queued twice.
+
+    Each device is polled again after its own poll_interval. Intervals
+    longer than one revolution of the wheel wait the needed number of
+    extra rounds in their slot.
+
+    Commands do not go through the workers, so a user turning something on
+    never waits for polls of other devices.
+    """
+
+    def __init__(
+        self,
+        hass,
+        max_concurrent=DEFAULT_MAX_CONCURRENT,
+        interval=POLL_INTERVAL,
+        slots=POLL_SLOTS,
+    ):
+        """Initialize the scheduler."""
+        self._hass = hass
+        self.max_concurrent = max_concurrent
+        self.interval = interval
+        self._wheel = [set() for _ in range(slots)]
+        self._slot_of = {}
+        self._rounds = {}
+        self._position = 0
+        self._timer = None
+        self._queue = asyncio.Queue()
+        self._queued = set()
+        self._workers = []
+        self._in_flight = 0
+        self._backlogged = False
+
+    def __len__(self):
+        """Return the number of scheduled devices."""
+        return len(self._slot_of)
+
+    @property
+    def queue_depth(self):
+        """Return the number of due polls waiting for a worker."""
+        return self._queue.qsize()
+
+    @property
+    def in_flight(self):
+        """Return the number of polls running right now."""
+        return self._in_flight
+
+    @callback
+    def add(self, device):
+        """Start polling device, which must provide async_poll() and poll_interval."""
+        if device in self._slot_of:
+            return
+        slot = min(range(len(self._wheel)), key=lambda i: len(self._wheel[i]))
+        self._wheel[slot].add(device)
+        self._slot_of[device] = slot
+        self._rounds[device] = 0
+        if self._timer is None:
+            self._start()
+
+    @callback
+    def remove(self, device):
+        """Stop polling device."""
+        slot = self._slot_of.pop(device, None)
+        if slot is not None:
+            self._wheel[slot].discard(device)
+            del self._rounds[device]
+        if not self._slot_of:
+            self.stop()
+
+    @callback
+    def stop(self, event=None):
+        """Stop the timer and the workers."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._queue = asyncio.Queue()
+        self._queued.clear()
+        self._backlogged = False
+
+    def _start(self):
+        self._workers = [
+            self._hass.async_create_task(self._worker())
+            for _ in range(self.max_concurrent)
+        ]
+        self._timer = self._hass.loop.call_later(self._tick, self._advance)
+
+    @property
+    def _tick(self):
+        return self.interval / len(self._wheel)
+
+    def _schedule(self, device, ticks):
+        slots = len(self._wheel)
+        slot = (self._position + ticks) % slots
+        self._wheel[slot].add(device)
+        self._slot_of[device] = slot
+        self._rounds[device] = (ticks - 1) // slots
+
+    @callback
+    def _advance(self):
+        self._position = (self._position + 1) % len(self._wheel)
+        due, self._wheel[self._position] = self._wheel[self._position], set()
+        for device in due:
+            if self._rounds[device] > 0:
+                self._rounds[device] -= 1
+                self._wheel[self._position].add(device)
+                continue
+            self._schedule(device, max(1, round(device.poll_interval / self._tick)))
+            if device not in self._queued:
+                self._queued.add(device)
+                self._queue.put_nowait(device)
+        self._log_backlog()
+        self._timer = self._hass.loop.call_later(self._tick, self._advance)
+
+    def _log_backlog(self):
+        # only changes are logged, so a lasting backlog does not flood the log
+        backlogged = self.queue_depth > self.max_concurrent
+        if backlogged and not self._backlogged:
+            _LOGGER.info(
+                "Poll queue backed up: %d polls queued, %d running, "
+                "consider raising max_concurrent_requests",
+                self.queue_depth,
+                self._in_flight,
+            )
+        elif self._backlogged and not self.queue_depth:
+            _LOGGER.info("Poll queue drained")
+        else:
+            return
+        self._backlogged = backlogged
+
+    async def _worker(self):
+        while True:
+            device = await self._queue.get()
+            self._queued.discard(device)
+            if device not in self._slot_of:
+                continue
+            self._in_flight += 1
+            try:
+                await device.async_poll()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Unexpected error while polling %s", device)
+            finally:
+                self._in_flight -= 1
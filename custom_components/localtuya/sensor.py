@@ -15,8 +15,6 @@ sensor:
     device_class: current
 """
 import logging
-from time import time, sleep
-from threading import Lock
 
 import voluptuous as vol
 
@@ -24,7 +22,6 @@ from homeassistant.components.sensor import DOMAIN, PLATFORM_SCHEMA, DEVICE_CLAS
 from homeassistant.const import (
     CONF_ID,
     CONF_DEVICE_CLASS,
-    CONF_FRIENDLY_NAME,
     CONF_UNIT_OF_MEASUREMENT,
     STATE_UNKNOWN,
 )
@@ -57,7 +54,7 @@ def flow_schema(dps):
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Setup a Tuya sensor based on a config entry."""
-    device, entities_to_setup = prepare_setup_entities(config_entry, DOMAIN)
+    device, entities_to_setup = prepare_setup_entities(hass, config_entry, DOMAIN)
     if not entities_to_setup:
         return
 
@@ -65,13 +62,13 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     for device_config in entities_to_setup:
         sensors.append(
             LocaltuyaSensor(
-                TuyaCache(device, config_entry.data[CONF_FRIENDLY_NAME]),
+                device,
                 config_entry,
                 device_config[CONF_ID],
             )
         )
 
-    async_add_entities(sensors, True)
+    async_add_entities(sensors)
 
 
 def setup_platform(hass, config, add_devices, discovery_info=None):
@@ -79,75 +76,6 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
     return import_from_yaml(hass, config, DOMAIN)
 
 
-class TuyaCache:
-    """Cache wrapper for pytuya.TuyaDevice"""
-
-    def __init__(self, device, friendly_name):
-        """Initialize the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        self._device = device
-        self._friendly_name = friendly_name
-        self._lock = Lock()
-
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return self._device.id
-
-    def __get_status(self):
-        for i in range(5):
-            try:
-                status = self._device.status()
-                return status
-            except Exception:
-                print(
-                    "Failed to update status of device [{}]".format(
-                        self._device.address
-                    )
-                )
-                sleep(1.0)
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to update status of device %s", self._device.address
-                    )
-                    #                    return None
-                    raise ConnectionError("Failed to update status .")
-
-    def set_dps(self, state, dps_index):
-        """Change the Tuya sensor status and clear the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        for i in range(5):
-            try:
-                return self._device.set_dps(state, dps_index)
-            except Exception:
-                print(
-                    "Failed to set status of device [{}]".format(self._device.address)
-                )
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to set status of device %s", self._device.address
-                    )
-                    return
-
-        #                    raise ConnectionError("Failed to set status.")
-        self.update()
-
-    def status(self):
-        """Get state of Tuya sensor and cache the results."""
-        self._lock.acquire()
-        try:
-            now = time()
-            if not self._cached_status or now - self._cached_status_time > 15:
-                sleep(0.5)
-                self._cached_status = self.__get_status()
-                self._cached_status_time = time()
-            return self._cached_status
-        finally:
-            self._lock.release()
-
-
 class LocaltuyaSensor(LocalTuyaEntity):
     """Representation of a Tuya sensor."""
 
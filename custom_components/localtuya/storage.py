@@ -0,0 +1,125 @@
+"""Facts learned about devices, kept across restarts."""
+import os
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util.json import load_json
+
+from .const import DOMAIN
+
+STORAGE_KEY = f"{DOMAIN}.devices"
+STORAGE_VERSION = 1
+SAVE_DELAY = 10
+
+PRODUCTS_STORAGE_KEY = f"{DOMAIN}.products"
+PRODUCTS_FILE = os.path.join(os.path.dirname(__file__), "products.json")
+
+DEVICE_STORE = "device_store"
+PRODUCT_STORE = "product_store"
+
+ATTR_DEV_TYPE = "dev_type"
+ATTR_DPS = "dps"
+ATTR_ENTITIES = "entities"
+ATTR_NAME = "name"
+
+
+class DeviceStore:
+    """What was learned about each device id, e.g. its dev_type.
+
+    Lets new connections start with the right request instead of finding
+    out again through a failed round trip.
+    """
+
+    def __init__(self, hass):
+        """Initialize an empty store."""
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._devices = {}
+
+    async def async_load(self):
+        """Load the stored devices."""
+        self._devices = await self._store.async_load() or {}
+
+    def get(self, device_id):
+        """Return what is known about a device."""
+        return self._devices.get(device_id, {})
+
+    @callback
+    def async_update(self, device_id, **info):
+        """Remember facts about a device, saving them if anything changed."""
+        info = {key: value for key, value in info.items() if value is not None}
+        device = self._devices.setdefault(device_id, {})
+        if all(device.get(key) == value for key, value in info.items()):
+            return
+        device.update(info)
+        self._store.async_delay_save(lambda: self._devices, SAVE_DELAY)
+
+
+async def async_get_device_store(hass):
+    """Return the device store, loading it on first use."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DEVICE_STORE not in data:
+        store = DeviceStore(hass)
+        await store.async_load()
+        data.setdefault(DEVICE_STORE, store)
+    return data[DEVICE_STORE]
+
+
+class ProductStore:
+    """Known dps layout and entities of each product, keyed by productKey.
+
+    Devices of the same model broadcast the same productKey. What was
+    learned from one of them lets the next one be added without probing
+    its dps. Layouts learned here take precedence over the ones in the
+    optional products.json shipped next to this module.
+    """
+
+    def __init__(self, hass):
+        """Initialize an empty store."""
+        self._hass = hass
+        self._store = Store(hass, STORAGE_VERSION, PRODUCTS_STORAGE_KEY)
+        self._bundled = {}
+        self._products = {}
+
+    async def async_load(self):
+        """Load the learned and the bundled products."""
+        self._products = await self._store.async_load() or {}
+        self._bundled = await self._hass.async_add_executor_job(
+            load_json, PRODUCTS_FILE, {}
+        )
+
+    def get(self, product_key):
+        """Return what is known about a product, None if nothing."""
+        if not product_key:
+            return None
+        return self._products.get(product_key) or self._bundled.get(product_key)
+
+    @callback
+    def async_learn(self, product_key, name, dps, entities, dev_type=None):
+        """Remember the layout of a configured device as the one of its product.
+
+        dps are the indexes the device has, entities its entity configs and
+        name the device name their friendly names may start with.
+        """
+        if not product_key or not dps:
+            return
+        product = {
+            ATTR_NAME: name,
+            ATTR_DPS: list(dps),
+            ATTR_ENTITIES: [dict(entity) for entity in entities],
+        }
+        if dev_type is not None:
+            product[ATTR_DEV_TYPE] = dev_type
+        if self._products.get(product_key) == product:
+            return
+        self._products[product_key] = product
+        self._store.async_delay_save(lambda: self._products, SAVE_DELAY)
+
+
+async def async_get_product_store(hass):
+    """Return the product store, loading it on first use."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if PRODUCT_STORE not in data:
+        store = ProductStore(hass)
+        await store.async_load()
+        data.setdefault(PRODUCT_STORE, store)
+    return data[PRODUCT_STORE]
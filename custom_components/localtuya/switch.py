@@ -25,8 +25,6 @@ switch:
         id: 7
 """
 import logging
-from time import time, sleep
-from threading import Lock
 
 import voluptuous as vol
 
@@ -95,7 +93,7 @@ def flow_schema(dps):
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Setup a Tuya switch based on a config entry."""
-    device, entities_to_setup = prepare_setup_entities(config_entry, DOMAIN)
+    device, entities_to_setup = prepare_setup_entities(hass, config_entry, DOMAIN)
     if not entities_to_setup:
         return
 
@@ -110,13 +108,13 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
 
         switches.append(
             LocaltuyaSwitch(
-                TuyaCache(device, config_entry.data[CONF_FRIENDLY_NAME]),
+                device,
                 config_entry,
                 device_config[CONF_ID],
             )
         )
 
-    async_add_entities(switches, True)
+    async_add_entities(switches)
 
 
 def setup_platform(hass, config, add_devices, discovery_info=None):
@@ -124,73 +122,6 @@ def setup_platform(hass, config, add_devices, discovery_info=None):
     return import_from_yaml(hass, config, DOMAIN)
 
 
-class TuyaCache:
-    def __init__(self, device, friendly_name):
-        """Initialize the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        self._device = device
-        self._friendly_name = friendly_name
-        self._lock = Lock()
-
-    @property
-    def unique_id(self):
-        """Return unique device identifier."""
-        return self._device.id
-
-    def __get_status(self):
-        for i in range(5):
-            try:
-                status = self._device.status()
-                return status
-            except Exception:
-                print(
-                    "Failed to update status of device [{}]".format(
-                        self._device.address
-                    )
-                )
-                sleep(1.0)
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to update status of device %s", self._device.address
-                    )
-                    #                    return None
-                    raise ConnectionError("Failed to update status .")
-
-    def set_dps(self, state, dps_index):
-        """Change the Tuya switch status and clear the cache."""
-        self._cached_status = ""
-        self._cached_status_time = 0
-        for i in range(5):
-            try:
-                return self._device.set_dps(state, dps_index)
-            except Exception:
-                print(
-                    "Failed to set status of device [{}]".format(self._device.address)
-                )
-                if i + 1 == 3:
-                    _LOGGER.error(
-                        "Failed to set status of device %s", self._device.address
-                    )
-                    return
-
-    #                    raise ConnectionError("Failed to set status.")
-        self.update()
-
-    def status(self):
-        """Get state of Tuya switch and cache the results."""
-        self._lock.acquire()
-        try:
-            now = time()
-            if not self._cached_status or now - self._cached_status_time > 15:
-                sleep(0.5)
-                self._cached_status = self.__get_status()
-                self._cached_status_time = time()
-            return self._cached_status
-        finally:
-            self._lock.release()
-
-
 class LocaltuyaSwitch(LocalTuyaEntity, SwitchEntity):
     """Representation of a Tuya switch."""
 
@@ -204,6 +135,7 @@ class LocaltuyaSwitch(LocalTuyaEntity, SwitchEntity):
         """Initialize the Tuya switch."""
         super().__init__(device, config_entry, switchid, **kwargs)
         self._state = None
+        self._attrs = {}
         print(
             "Initialized tuya switch [{}] with switch status [{}] and state [{}]".format(
                 self.name, self._status, self._state
@@ -217,25 +149,39 @@ class LocaltuyaSwitch(LocalTuyaEntity, SwitchEntity):
 
     @property
     def device_state_attributes(self):
-        attrs = {}
-        if self._config.get(CONF_CURRENT, "-1") != "-1":
-            attrs[ATTR_CURRENT] = self.dps(self._config[CONF_CURRENT])
-        if self._config.get(ATTR_CURRENT_CONSUMPTION, "-1") != "-1":
-            attrs[ATTR_CURRENT_CONSUMPTION] = (
-                self.dps(self._config[CONF_CURRENT_CONSUMPTION]) / 10
-            )
-        if self._config.get(CONF_VOLTAGE, "-1") != "-1":
-            attrs[ATTR_VOLTAGE] = self.dps(self._config[CONF_VOLTAGE]) / 10
-        return attrs
+        """Return the power readings of the switch."""
+        return self._attrs
 
-    def turn_on(self, **kwargs):
+    async def async_turn_on(self, **kwargs):
         """Turn Tuya switch on."""
-        self._device.set_dps(True, self._dps_id)
+        await self._device.async_set_dps(True, self._dps_id)
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turn Tuya switch off."""
-        self._device.set_dps(False, self._dps_id)
+        await self._device.async_set_dps(False, self._dps_id)
+
+    def dps_dependencies(self):
+        """Return the dps of the switch and of its power readings."""
+        dependencies = {self._dps_id}
+        for conf in (CONF_CURRENT, CONF_CURRENT_CONSUMPTION, CONF_VOLTAGE):
+            if self._config.get(conf, "-1") != "-1":
+                dependencies.add(self._config[conf])
+        return dependencies
 
     def status_updated(self):
         """Device statua was updated."""
         self._state = self.dps(self._dps_id)
+        # computed here so unchanged readings do not rebuild them
+        attrs = {}
+        if self._config.get(CONF_CURRENT, "-1") != "-1":
+            attrs[ATTR_CURRENT] = self.dps(self._config[CONF_CURRENT])
+        # readings the device has not reported yet are left out
+        if self._config.get(ATTR_CURRENT_CONSUMPTION, "-1") != "-1":
+            consumption = self.dps(self._config[CONF_CURRENT_CONSUMPTION])
+            if consumption is not None:
+                attrs[ATTR_CURRENT_CONSUMPTION] = consumption / 10
+        if self._config.get(CONF_VOLTAGE, "-1") != "-1":
+            voltage = self.dps(self._config[CONF_VOLTAGE])
+            if voltage is not None:
+                attrs[ATTR_VOLTAGE] = voltage / 10
+        self._attrs = attrs